@@ -94,14 +94,14 @@ class DFRobot_Expansion_Board:
     self._write_bytes(self._REG_SLAVE_ADDR, [addr])
 
   def _parse_id(self, limit, id):
+    if id == self.ALL:
+      return range(1, limit + 1)
     ld = []
     if isinstance(id, list) == False:
       id = id + 1
       ld.append(id)
     else:
       ld = [i + 1 for i in id]
-    if ld == self.ALL:
-      return range(1, limit + 1)
     for i in ld:
       if i < 1 or i > limit:
         self.last_operate_status = self.STA_ERR_PARAMETER
@@ -169,8 +169,13 @@ class DFRobot_Expansion_Board:
     '''
       @brief    Get adc value
       @param chan: int    Channel to get, in range 1 to 4, or self.ALL
-      @return :list       List of value
+      @return :int        Value of the channel, or a list with the value of every channel for self.ALL
     '''
+    if chan == self.ALL:
+      # The value registers are contiguous: read all channels in one transaction
+      rslt = self._read_bytes(self._REG_ADC_VAL1, _ADC_CHAN_COUNT * 2)
+      return [(rslt[i * 2] << 8) | rslt[i * 2 + 1] for i in range(_ADC_CHAN_COUNT)]
+    rslt = [0, 0]
     for i in self._parse_id(_ADC_CHAN_COUNT, chan):
       rslt = self._read_bytes(self._REG_ADC_VAL1 + (i - 1) * 2, 2)
     return ((rslt[0] << 8) | rslt[1])
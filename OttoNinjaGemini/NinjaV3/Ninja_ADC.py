@@ -0,0 +1,156 @@
+# -*- coding:utf-8 -*-
+
+'''!
+  @file Ninja_ADC.py
+  @brief Background sampler for the expansion board's analog inputs (battery voltage, load).
+  @n All four channels are read in one block read per sample, queued on the bus owner at
+  @n background priority and coalesced, so servo writes always go first and a busy bus
+  @n never builds up a backlog of samples. Samples are kept in a ring buffer; the battery
+  @n voltage is low-pass filtered as each sample arrives, so reading it costs nothing.
+  @n speed_scale() tells the gaits how much to slow down while the battery sags.
+  @license The MIT License (MIT)
+'''
+
+import math
+import time
+import threading
+import collections
+
+import Ninja_Bus
+
+# --- Configuration ---
+ADC_CHANNELS = 4
+ADC_MAX = 4095 # 12-bit converter
+ADC_REFERENCE_VOLTAGE = 3.3 # Volts at ADC_MAX
+SAMPLE_RATE = 10.0 # Samples per second
+BUFFER_SECONDS = 30.0 # History kept in the ring buffer
+BATTERY_FILTER_TIME_CONSTANT = 3.0 # Seconds; long enough that a single step's current spike doesn't count as sag
+BATTERY_PRESENT_VOLTAGE = 1.0 # Lower readings mean no battery is wired to the channel (no speed scaling)
+STALE_SAMPLE_AGE = 1.0 # Seconds after which the filtered voltage is no longer trusted
+MIN_SPEED_SCALE = 0.6 # Gait speed factor at the sag_floor voltage
+
+# --- Sampler ---
+
+class AdcSampler:
+    """
+    Samples every ADC channel at `rate` Hz through a Ninja_Bus.BusOwner.
+    battery is the battery section of the calibration (see Ninja_Calibration.DEFAULT_BATTERY_CALIBRATION).
+    """
+    def __init__(self, bus, battery, rate=SAMPLE_RATE, buffer_seconds=BUFFER_SECONDS):
+        self._bus = bus
+        self._board = bus.board
+        self._battery = battery
+        self._interval = 1.0 / rate
+        self._samples = collections.deque(maxlen=max(1, int(rate * buffer_seconds))) # (time, raw values)
+        self._lock = threading.Lock() # Guards the ring buffer
+        self._stop_event = threading.Event()
+        self._thread = None
+        # (time of the last sample, filtered battery voltage), None until the first sample.
+        # One tuple, replaced as a whole, so readers on other threads never see half an update.
+        self._battery_reading = None
+        self.sample_count = 0
+
+    # --- Worker Control ---
+
+    def start(self):
+        """Enables the ADC and starts sampling."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._bus.write(('adc', 'control'), self._board.set_adc_enable, priority=Ninja_Bus.PRIORITY_BACKGROUND)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="adc-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling; the buffer and the last voltage are kept."""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            # Coalesced: if the previous sample is still waiting for the bus, it is not queued twice
+            self._bus.write(('adc', 'values'), self._sample, priority=Ninja_Bus.PRIORITY_BACKGROUND)
+            next_time += self._interval
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                next_time, delay = time.monotonic(), 0 # Fell behind: skip ticks instead of bursting
+            self._stop_event.wait(delay)
+
+    def _sample(self):
+        """Runs on the bus thread: one block read of every channel."""
+        values = self._board.get_adc_value(self._board.ALL)
+        if self._board.last_operate_status != self._board.STA_OK:
+            return # The bus owner counts and reports the error
+        now = time.monotonic()
+        voltage = to_volts(values[self._battery["channel"]]) * self._battery["divider"]
+        with self._lock:
+            self._samples.append((now, tuple(values)))
+        reading = self._battery_reading
+        if reading is not None:
+            last_time, filtered = reading
+            alpha = 1.0 - math.exp(-(now - last_time) / BATTERY_FILTER_TIME_CONSTANT)
+            voltage = filtered + (voltage - filtered) * alpha
+        self._battery_reading = (now, voltage)
+        self.sample_count += 1
+
+    # --- Readings ---
+
+    def battery_voltage(self):
+        """Filtered battery voltage, or None without a recent reading (no battery wired, or sampling stopped)."""
+        reading = self._battery_reading
+        if reading is None:
+            return None
+        last_time, voltage = reading
+        if voltage < BATTERY_PRESENT_VOLTAGE or time.monotonic() - last_time > STALE_SAMPLE_AGE:
+            return None
+        return voltage
+
+    def speed_scale(self):
+        """
+        Gait speed factor: 1.0 down to sag_start, falling linearly to MIN_SPEED_SCALE at
+        sag_floor and below. 1.0 without a (recent) battery reading.
+        """
+        voltage = self.battery_voltage()
+        if voltage is None:
+            return 1.0
+        start, floor = self._battery["sag_start"], self._battery["sag_floor"]
+        if voltage >= start:
+            return 1.0
+        sag = (start - voltage) / max(start - floor, 1e-6)
+        return max(MIN_SPEED_SCALE, 1.0 - (1.0 - MIN_SPEED_SCALE) * sag)
+
+    def stats(self):
+        """Battery voltage, speed scale and per-channel pin voltages (latest/mean/min/max) over the buffer."""
+        with self._lock:
+            samples = list(self._samples)
+        channels = []
+        for channel in range(ADC_CHANNELS):
+            volts = [to_volts(values[channel]) for _, values in samples]
+            channels.append({
+                "voltage": round(volts[-1], 3),
+                "mean": round(sum(volts) / len(volts), 3),
+                "min": round(min(volts), 3),
+                "max": round(max(volts), 3),
+            } if volts else {})
+        span = samples[-1][0] - samples[0][0] if len(samples) > 1 else 0.0
+        battery = self._battery
+        voltage = self.battery_voltage()
+        present = voltage is not None and bool(samples)
+        return {
+            "battery_voltage": round(voltage, 2) if present else None,
+            # Lowest unfiltered reading in the buffer: how far the battery sags under load
+            "battery_min_voltage": round(channels[battery["channel"]]["min"] * battery["divider"], 2) if present else None,
+            "speed_scale": round(self.speed_scale(), 2),
+            "channels": channels,
+            "sample_rate": round((len(samples) - 1) / span, 1) if span else 0.0,
+            "window_seconds": round(span, 1),
+            "samples": self.sample_count,
+        }
+
+
+def to_volts(raw):
+    """Voltage at an ADC pin for a raw reading."""
+    return raw * ADC_REFERENCE_VOLTAGE / ADC_MAX
@@ -0,0 +1,356 @@
+# -*- coding:utf-8 -*-
+
+'''!
+  @file Ninja_Bus.py
+  @brief Single owner thread for the I2C expansion board.
+  @n Movement threads, web requests and the obstacle stop path all hand their register
+  @n accesses to one worker, so transactions never interleave. Pending writes to the same
+  @n channel are coalesced (only the newest value is sent) and stop frames jump the queue.
+  @license The MIT License (MIT)
+'''
+
+import math
+import time
+import heapq
+import threading
+from concurrent import futures
+
+# --- Priorities (lower runs first) ---
+PRIORITY_STOP = 0 # Stop / emergency frames
+PRIORITY_NORMAL = 1 # Gait and pose writes
+PRIORITY_BACKGROUND = 2 # Sensor polling and other work that can wait
+
+ERROR_REPORT_INTERVAL = 5.0 # Seconds between repeated bus error messages
+
+# --- Servo Arrival Model ---
+UNKNOWN_POSITION_TRAVEL = 90 # Degrees assumed for the first move of a servo (position unknown)
+SERVO_SETTLE_TIME = 0.02 # Extra time after the estimated arrival (seconds)
+RELAXED_SAG_TRAVEL = 20 # Degrees a powered-down servo is assumed to have drifted when it is woken up
+
+# --- Servo Load Model ---
+# Load is a thermal estimate in 0..1: moving counts 1.0, holding torque HOLD_LOAD and a
+# powered-down servo 0, averaged with an exponential time constant.
+HOLD_LOAD = 0.3
+THERMAL_TIME_CONSTANT = 120.0 # Seconds
+
+
+class BusOwner:
+    """
+    Serializes every access to a DFRobot_Expansion_Board. write() is fire-and-forget
+    and coalesced per key; call() returns a Future with the result.
+    """
+    def __init__(self, board):
+        self.board = board
+        self._heap = [] # (priority, sequence, (key, priority))
+        self._pending = {} # (key, priority) -> (function, args, future or None, priority, sequence of its heap entry)
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._idle = threading.Event()
+        self._idle.set()
+        # Statistics
+        self.coalesced = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self._window_start = time.monotonic()
+        self._window_busy = 0.0
+        self._window_ops = 0
+        self.bus_time_per_second = 0.0 # Busy fraction of the last full 1 s window
+        self.ops_per_second = 0
+        self._last_error_report = 0.0
+
+    # --- Worker Control ---
+
+    def start(self):
+        """Starts the bus worker thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="i2c-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """Sends what is still queued, then stops the worker."""
+        self.flush(timeout)
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def flush(self, timeout=None):
+        """Blocks until the queue is empty. Returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    # --- Submitting Work ---
+
+    def write(self, key, function, *args, priority=PRIORITY_NORMAL):
+        """
+        Queues function(*args) to run on the bus thread. A write with the same key (e.g. a
+        PWM channel) and the same or a lower priority that is still waiting is replaced by
+        this one. A more urgent write still waiting for the key (e.g. a stop frame) is never
+        replaced: this one is queued to run after it.
+        """
+        self._enqueue(key, function, args, None, priority)
+
+    def call(self, function, *args, priority=PRIORITY_NORMAL):
+        """Queues function(*args) and returns a Future for its result (never coalesced)."""
+        future = futures.Future()
+        self._enqueue(None, function, args, future, priority)
+        return future
+
+    def _enqueue(self, key, function, args, future, priority):
+        with self._condition:
+            if key is None:
+                key = ('call', self._sequence) # Unique: calls are never merged
+            # Waiting writes of the key with a lower priority are older values: drop them
+            for lower in range(priority + 1, PRIORITY_BACKGROUND + 1):
+                if self._pending.pop((key, lower), None):
+                    self.coalesced += 1 # Its heap entry becomes stale
+            slot = (key, priority)
+            queued = self._pending.get(slot)
+            if queued:
+                # Keep the queue position of the waiting write, send the newest value
+                self.coalesced += 1
+                self._pending[slot] = (function, args, future, queued[3], queued[4])
+            else:
+                self._pending[slot] = (function, args, future, priority, self._sequence)
+                heapq.heappush(self._heap, (priority, self._sequence, slot))
+                self._sequence += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            self._idle.clear()
+            self._condition.notify()
+
+    # --- Worker ---
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._idle.set()
+                    self._condition.wait()
+                if not self._running and not self._pending:
+                    self._idle.set()
+                    return
+                _, sequence, slot = heapq.heappop(self._heap)
+                item = self._pending.get(slot)
+                if item is None or item[4] != sequence:
+                    continue # Stale entry of a write that was merged or superseded
+                del self._pending[slot]
+            self._execute(*item[:3])
+
+    def _execute(self, function, args, future):
+        start_time = time.monotonic()
+        if future is not None and not future.set_running_or_notify_cancel():
+            return
+        self.board.last_operate_status = self.board.STA_OK
+        try:
+            result = function(*args)
+        except Exception as e:
+            result = None
+            self._report_error(f"{getattr(function, '__name__', function)} raised {e}")
+            if future is not None:
+                future.set_exception(e)
+                future = None
+        else:
+            if self.board.last_operate_status != self.board.STA_OK:
+                # The board class swallows I/O errors and only sets last_operate_status
+                self._report_error(f"{getattr(function, '__name__', function)} failed (status {self.board.last_operate_status})")
+                if future is not None:
+                    future.set_exception(IOError(f"I2C operation failed (status {self.board.last_operate_status})"))
+                    future = None
+        if future is not None:
+            future.set_result(result)
+        self._account(start_time, time.monotonic())
+
+    def _report_error(self, message):
+        self.errors += 1
+        now = time.monotonic()
+        if now - self._last_error_report >= ERROR_REPORT_INTERVAL:
+            self._last_error_report = now
+            print(f"I2C bus error: {message} ({self.errors} errors so far)")
+
+    def _account(self, start_time, end_time):
+        """Adds one operation to the bus-time window, rolling it over every second."""
+        if end_time - self._window_start >= 1.0:
+            elapsed = end_time - self._window_start
+            self.bus_time_per_second = self._window_busy / elapsed
+            self.ops_per_second = round(self._window_ops / elapsed)
+            self._window_start = end_time
+            self._window_busy = 0.0
+            self._window_ops = 0
+        self._window_busy += end_time - start_time
+        self._window_ops += 1
+
+    # --- Status ---
+
+    def stats(self):
+        """Returns queue depth, bus utilisation and error counters."""
+        with self._condition:
+            depth = len(self._pending)
+        if time.monotonic() - self._window_start >= 2.0:
+            busy, ops = 0.0, 0 # No traffic lately
+        else:
+            busy, ops = self.bus_time_per_second, self.ops_per_second
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": self.max_queue_depth,
+            "bus_time_per_second": round(busy, 4),
+            "ops_per_second": ops,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+        }
+
+
+class ServoChannels:
+    """
+    Servo front end with the DFRobot_Expansion_Board_Servo interface that routes moves
+    through the bus owner. tables[servo_id][angle] holds the ready register write
+    (see Ninja_Calibration.build_servo_tables), so a move is a lookup plus one write.
+    Each servo's commanded motion is tracked with a constant-speed model (speeds in
+    deg/s), so callers can wait exactly until the servos should have arrived.
+    relax() switches the pulses off (no holding torque); the next move wakes every
+    relaxed servo back up at its last angle first.
+    """
+    def __init__(self, bus, servo, tables, speeds):
+        self._bus = bus
+        self._servo = servo
+        self._tables = tables
+        self._speeds = speeds
+        self._write = bus.board._write_bytes
+        self._motion = [None] * len(tables) # (start_angle, target, start_time, arrival_time) per servo
+        self._lock = threading.Lock() # Guards the relaxed flags and the usage counters
+        self._relaxed = [False] * len(tables)
+        self.last_command_time = time.monotonic()
+        self._start_time = self.last_command_time
+        # Usage per servo: powered/moving seconds, degrees travelled, thermal load
+        self._usage = [{"powered_seconds": 0.0, "moving_seconds": 0.0, "travel_degrees": 0.0,
+                        "load": 0.0, "updated": self._start_time} for _ in tables]
+
+    def begin(self):
+        return self._bus.call(self._servo.begin).result()
+
+    def move(self, id, angle, priority=PRIORITY_NORMAL):
+        if 0 <= angle <= 180:
+            self.last_command_time = time.monotonic()
+            if any(self._relaxed):
+                self.wake(priority, skip=id)
+            register, data = self._tables[id][int(angle + 0.5)]
+            self._bus.write(('servo', id), self._write, register, data, priority=priority)
+            self._track(id, angle)
+
+    # --- Power ---
+
+    def relax(self, ids=None, priority=PRIORITY_BACKGROUND):
+        """Sets the duty of the given (default: all) servos to 0, removing holding torque."""
+        ids = range(len(self._tables)) if ids is None else ids
+        now = time.monotonic()
+        for id in ids:
+            register = self._tables[id][0][0]
+            self._bus.write(('servo', id), self._write, register, [0, 0], priority=priority)
+            with self._lock:
+                self._account_usage(id, now)
+                self._relaxed[id] = True
+
+    def wake(self, priority=PRIORITY_NORMAL, skip=None):
+        """Powers relaxed servos back up at their last commanded angle."""
+        for id in range(len(self._tables)):
+            if id == skip or not self._relaxed[id]:
+                continue
+            target = self.target_angle(id)
+            if target is None:
+                with self._lock:
+                    self._relaxed[id] = False
+                continue
+            register, data = self._tables[id][int(target + 0.5)]
+            self._bus.write(('servo', id), self._write, register, data, priority=priority)
+            self._track(id, target)
+
+    def is_relaxed(self):
+        """True if any servo is powered down."""
+        return any(self._relaxed)
+
+    def idle_time(self):
+        """Seconds since the last move command."""
+        return time.monotonic() - self.last_command_time
+
+    # --- Arrival Model ---
+
+    def _track(self, id, target):
+        now = time.monotonic()
+        current = self.estimated_angle(id, now)
+        with self._lock:
+            self._account_usage(id, now)
+            if current is None:
+                current, travel = target, UNKNOWN_POSITION_TRAVEL
+            elif self._relaxed[id]:
+                travel = max(abs(target - current), RELAXED_SAG_TRAVEL) # It may have sagged while unpowered
+            else:
+                travel = abs(target - current)
+            self._relaxed[id] = False
+            self._motion[id] = (current, target, now, now + travel / self._speeds[id])
+            self._usage[id]["travel_degrees"] += abs(target - current)
+
+    def estimated_angle(self, id, now=None):
+        """Where the servo should be now (None until it has been commanded once)."""
+        motion = self._motion[id]
+        if motion is None:
+            return None
+        start, target, start_time, arrival_time = motion
+        now = time.monotonic() if now is None else now
+        if now >= arrival_time:
+            return target
+        return start + (target - start) * (now - start_time) / (arrival_time - start_time)
+
+    def target_angle(self, id):
+        """Last commanded angle of a servo, or None."""
+        motion = self._motion[id]
+        return motion[1] if motion else None
+
+    def arrival_time(self, ids=None):
+        """time.monotonic() value at which the given (default: all) servos should have arrived."""
+        ids = range(len(self._motion)) if ids is None else ids
+        return max((self._motion[i][3] for i in ids if self._motion[i]), default=0.0)
+
+    def wait_until_arrived(self, ids=None):
+        """Sleeps only as long as the slowest of the given servos still needs."""
+        remaining = self.arrival_time(ids) + SERVO_SETTLE_TIME - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    # --- Usage / Load Model ---
+
+    def _account_usage(self, id, now):
+        """Adds the time since the last update to a servo's counters (call with self._lock held)."""
+        usage = self._usage[id]
+        motion = self._motion[id]
+        start = usage["updated"]
+        if self._relaxed[id] or motion is None:
+            segments = [(now - start, 0.0)] # No pulses: no torque, no heat
+        else:
+            moving_until = min(max(motion[3], start), now)
+            segments = [(moving_until - start, 1.0), (now - moving_until, HOLD_LOAD)]
+            usage["powered_seconds"] += now - start
+            usage["moving_seconds"] += moving_until - start
+        for duration, level in segments:
+            usage["load"] = level + (usage["load"] - level) * math.exp(-duration / THERMAL_TIME_CONSTANT)
+        usage["updated"] = now
+
+    def usage_stats(self):
+        """Per servo: powered (bool), duty_cycle (powered share of uptime), moving_seconds, travel_degrees, load."""
+        now = time.monotonic()
+        uptime = max(now - self._start_time, 1e-6)
+        stats = []
+        with self._lock:
+            for id, usage in enumerate(self._usage):
+                self._account_usage(id, now)
+                stats.append({
+                    "powered": not self._relaxed[id] and self._motion[id] is not None,
+                    "duty_cycle": round(usage["powered_seconds"] / uptime, 3),
+                    "moving_seconds": round(usage["moving_seconds"], 1),
+                    "travel_degrees": round(usage["travel_degrees"]),
+                    "load": round(usage["load"], 3),
+                })
+        return stats
@@ -87,6 +87,10 @@ SOUND_MAP = {
     # ... and so on
 }
 
+# --- Playback Settings ---
+NOTE_DUTY_CYCLE = 50 # Standard volume
+NOTE_GAP = 0.015 # Silence between notes (slightly longer gap might help definition)
+
 # --- Functions ---
 def setup():
     """Set up GPIO mode and buzzer pin."""
@@ -96,24 +100,51 @@ def setup():
     GPIO.output(BUZZER_PIN, GPIO.LOW)
     print("GPIO setup complete.")
 
-def play_sequence(pwm, sequence):
-    """Plays a standard sequence of (note, duration) tuples."""
-    associated_words = [k for k, v in SOUND_MAP.items() if v == sequence]
-    print(f"Playing sequence for '{associated_words[0] if associated_words else 'Unknown'}' ({len(sequence)} notes)...")
-    for note, duration in sequence:
+def compile_sequence(sequence):
+    """Compiles (note, duration) tuples into (frequency, duty, duration, gap) steps."""
+    steps = []
+    last_index = len(sequence) - 1
+    for i, (note, duration) in enumerate(sequence):
         frequency = NOTES.get(note, 0)
-        if frequency == 0:
-            pwm.ChangeDutyCycle(0)
-        else:
+        duty = NOTE_DUTY_CYCLE if frequency else 0
+        gap = NOTE_GAP if frequency and i < last_index else 0
+        steps.append((frequency, duty, duration, gap))
+    return tuple(steps)
+
+def play_compiled(pwm, name, steps):
+    """Plays precompiled (frequency, duty, duration, gap) steps."""
+    print(f"Playing sequence for '{name}' ({len(steps)} notes)...")
+    for frequency, duty, duration, gap in steps:
+        if duty:
             pwm.ChangeFrequency(frequency)
-            pwm.ChangeDutyCycle(50) # Standard volume
+        pwm.ChangeDutyCycle(duty)
         time.sleep(duration)
-        if frequency != 0 and sequence.index((note, duration)) < len(sequence) - 1:
-             pwm.ChangeDutyCycle(0)
-             time.sleep(0.015) # Slightly longer gap might help definition
+        if gap:
+            pwm.ChangeDutyCycle(0)
+            time.sleep(gap)
     pwm.ChangeDutyCycle(0)
     print("Sequence finished.")
 
+def play_sequence(pwm, sequence):
+    """Plays a standard sequence of (note, duration) tuples."""
+    compiled = _COMPILED_BY_SEQUENCE.get(id(sequence))
+    if compiled is None:
+        # User-defined melody: compile once for this call (still O(n))
+        compiled = ('Unknown', compile_sequence(sequence))
+    play_compiled(pwm, *compiled)
+
+# --- Precompiled Sound Table (built once at import) ---
+# keyword -> (name, steps); name is the first keyword mapped to the sequence
+COMPILED_SOUNDS = {}
+_COMPILED_BY_SEQUENCE = {} # id(sequence) -> (name, steps)
+for _word, _sound in SOUND_MAP.items():
+    if not isinstance(_sound, list):
+        continue # Special functions (scared, exciting) are not sequences
+    if id(_sound) not in _COMPILED_BY_SEQUENCE:
+        _COMPILED_BY_SEQUENCE[id(_sound)] = (_word, compile_sequence(_sound))
+    COMPILED_SOUNDS[_word] = _COMPILED_BY_SEQUENCE[id(_sound)]
+del _word, _sound
+
 def play_scared_sound(pwm, total_duration=1.0, tremble_freq1='A#5', tremble_freq2='B5', duty_cycle=30):
     """Plays a trembling sound (quietly)."""
     # (Keep this function as it was, if 'scared' is in SOUND_MAP)
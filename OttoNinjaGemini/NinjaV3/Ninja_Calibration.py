@@ -0,0 +1,122 @@
+# -*- coding:utf-8 -*-
+
+'''!
+  @file Ninja_Calibration.py
+  @brief Per-servo calibration and precomputed angle -> PWM register tables.
+  @n The gait tables in Ninja_Movements_v1.py are shared by every robot; differences
+  @n between robots (horn mounting, mirrored servos, travel limits) live in a small
+  @n calibration file. At startup every angle 0-180 of every servo is converted once
+  @n into the duty register address and the two bytes the expansion board expects,
+  @n so moving a servo is a table lookup plus one I2C write.
+  @license The MIT License (MIT)
+'''
+
+import json
+import os
+
+# --- Configuration ---
+SERVO_COUNT = 4
+ANGLE_MIN = 0
+ANGLE_MAX = 180
+PWM_DUTY_REGISTER = 0x06 # DFRobot_Expansion_Board._REG_PWM_DUTY1, channels are 2 bytes apart
+
+# offset:    degrees added to every angle (corrects horn mounting)
+# trim:      travel scale around 90 degrees (1.0 = nominal, e.g. 0.95 for a servo that over-travels)
+# direction: 1, or -1 for a servo mounted mirrored
+# min / max: limits of the commanded angle; anything outside is clamped
+# speed:     loaded servo speed in degrees per second (used to estimate when a move has finished)
+DEFAULT_SERVO_CALIBRATION = {"offset": 0.0, "trim": 1.0, "direction": 1, "min": ANGLE_MIN, "max": ANGLE_MAX, "speed": 300.0}
+
+# rotation_speed:  body rotation in tire mode at full wheel velocity (degrees per second)
+# turn_step_angle: body rotation of one turnleft_step/turnright_step (degrees)
+DEFAULT_MOTION_CALIBRATION = {"rotation_speed": 180.0, "turn_step_angle": 20.0}
+
+# channel:   ADC channel (0-3 = A0-A3) the battery voltage divider is wired to
+# divider:   battery volts per volt at the ADC pin (e.g. 3.0 for a 20k/10k divider)
+# sag_start: filtered battery voltage below which gaits are slowed down
+# sag_floor: voltage at which gaits reach the minimum speed scale
+DEFAULT_BATTERY_CALIBRATION = {"channel": 0, "divider": 3.0, "sag_start": 7.0, "sag_floor": 6.2}
+
+# --- Functions ---
+
+def _read_calibration_file(path):
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read calibration '{path}': {e}. Using defaults.")
+    return None
+
+
+def load_calibration(path):
+    """
+    Reads {"servos": {"0": {...}, ...}} from a JSON file. Missing servos or keys use
+    DEFAULT_SERVO_CALIBRATION. Returns a list with one dict per servo.
+    """
+    data = _read_calibration_file(path)
+    if data is None:
+        print("No servo calibration file found. Using defaults.")
+        servos = {}
+    else:
+        servos = data.get("servos", {})
+        print(f"Loaded servo calibration from {path}.")
+
+    calibration = []
+    for servo_id in range(SERVO_COUNT):
+        entry = dict(DEFAULT_SERVO_CALIBRATION)
+        entry.update(servos.get(str(servo_id), {}))
+        calibration.append(entry)
+    return calibration
+
+
+def load_motion_calibration(path):
+    """
+    Reads the {"motion": {...}} section (how far the robot turns) from the calibration
+    file. Missing keys use DEFAULT_MOTION_CALIBRATION.
+    """
+    motion = dict(DEFAULT_MOTION_CALIBRATION)
+    data = _read_calibration_file(path)
+    if data is not None:
+        motion.update(data.get("motion", {}))
+    return motion
+
+
+def load_battery_calibration(path):
+    """
+    Reads the {"battery": {...}} section (voltage divider and sag thresholds) from the
+    calibration file. Missing keys use DEFAULT_BATTERY_CALIBRATION.
+    """
+    battery = dict(DEFAULT_BATTERY_CALIBRATION)
+    data = _read_calibration_file(path)
+    if data is not None:
+        battery.update(data.get("battery", {}))
+    return battery
+
+
+def duty_bytes(angle):
+    """Register bytes for a physical angle, exactly as DFRobot's Servo.move() + set_pwm_duty() compute them."""
+    duty = (0.5 + (float(angle) / 90.0)) / 20 * 100
+    return (int(duty), int((duty * 10) % 10))
+
+
+def physical_angle(calibration, angle):
+    """Applies limits, trim, direction and offset to a commanded angle."""
+    angle = max(calibration["min"], min(calibration["max"], angle))
+    angle = 90 + calibration["direction"] * calibration["trim"] * (angle - 90) + calibration["offset"]
+    return max(ANGLE_MIN, min(ANGLE_MAX, angle))
+
+
+def build_servo_tables(calibration):
+    """
+    Returns tables[servo_id][angle] = (register, [duty_int, duty_tenths]) for every
+    integer angle 0-180, ready to pass to the board's _write_bytes().
+    """
+    tables = []
+    for servo_id, entry in enumerate(calibration):
+        register = PWM_DUTY_REGISTER + servo_id * 2
+        tables.append(tuple(
+            (register, list(duty_bytes(physical_angle(entry, angle))))
+            for angle in range(ANGLE_MIN, ANGLE_MAX + 1)
+        ))
+    return tables
@@ -29,23 +29,30 @@ SPEED_OF_SOUND = 34300
 # Sensor range is typically ~4m. Max time for 4m round trip = (400*2)/34300 = ~0.023s
 # A slightly longer timeout is safer. 0.1s allows for ~17m range detection theoretically.
 MEASUREMENT_TIMEOUT = 0.1
+# Time the sensor needs after setup before the first reading (seconds)
+SETTLE_TIME = 1.0
+
 
 # Flag to track if GPIO has been set up
 gpio_initialized = False
+# time.monotonic() value after which the sensor has settled
+settle_until = 0.0
 
 # --- Functions ---
 
 def setup_sensor():
-    """Sets up the GPIO pins for the ultrasonic sensor."""
-    global gpio_initialized
+    """
+    Sets up the GPIO pins for the ultrasonic sensor.
+    Returns immediately; the settle time is waited out by the first measure_distance().
+    """
+    global gpio_initialized, settle_until
     try:
         GPIO.setmode(GPIO_MODE)
         GPIO.setup(TRIG_PIN, GPIO.OUT)
         GPIO.setup(ECHO_PIN, GPIO.IN)
         # Ensure trigger pin is low initially
         GPIO.output(TRIG_PIN, False)
-        print("Waiting for sensor to settle...")
-        time.sleep(1) # Allow sensor to settle after setup
+        settle_until = time.monotonic() + SETTLE_TIME # Allow sensor to settle after setup
         gpio_initialized = True
         print("GPIO setup complete.")
     except Exception as e:
@@ -64,6 +71,11 @@ def measure_distance():
         print("Error: GPIO not initialized.")
         return -2
 
+    settle_remaining = settle_until - time.monotonic()
+    if settle_remaining > 0:
+        print("Waiting for sensor to settle...")
+        time.sleep(settle_remaining)
+
     try:
         # --- Send Trigger Pulse ---
         GPIO.output(TRIG_PIN, True)
@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+
+'''!
+  @file Ninja_Http.py
+  @brief Shared keep-alive HTTP session for the cloud speech recognition and TTS calls.
+  @n One pooled requests.Session is reused for every utterance, so the TCP/TLS handshake
+  @n to Google is paid once per host instead of per request. Per-host connection limits are set
+  @n on the pool (an HTTPAdapter mounted on the session) and connection reuse can be
+  @n read back with connection_stats().
+  @license The MIT License (MIT)
+'''
+
+import threading
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    requests_available = True
+except ImportError:
+    print("Warning: 'requests' not installed. Speech recognition and TTS will open a new connection per request.")
+    requests_available = False
+
+# --- Configuration ---
+POOL_HOSTS = 4 # Number of hosts whose connection pools are kept
+POOL_CONNECTIONS_PER_HOST = 2 # Max open connections per host (callers wait for a free one)
+HTTP_TIMEOUT = 10.0 # Seconds per request (connect + read)
+WARM_UP_URLS = ("https://www.google.com/", "https://translate.google.com/") # Speech API and TTS hosts
+
+# --- Global Variables ---
+session = None
+session_lock = threading.Lock()
+
+# --- Functions ---
+
+def get_session():
+    """Returns the shared pooled session (created on first use), or None without 'requests'."""
+    global session
+    if not requests_available:
+        return None
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST, pool_block=True)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        return session
+
+
+def warm_up():
+    """Opens the connections to the speech and TTS hosts ahead of the first utterance."""
+    http = get_session()
+    if http is None:
+        return
+    for url in WARM_UP_URLS:
+        try:
+            http.head(url, timeout=HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"Warning: Could not pre-connect to {url}: {e}")
+
+
+def connection_stats():
+    """
+    Returns {host: {"requests": n, "connections": n, "reused": n}} for the pooled hosts.
+    "reused" counts requests that were sent over an already open connection.
+    """
+    stats = {}
+    if session is None:
+        return stats
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()} # Same adapter is mounted twice
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}"
+            entry = stats.setdefault(host, {"requests": 0, "connections": 0, "reused": 0})
+            entry["requests"] += pool.num_requests
+            entry["connections"] += pool.num_connections
+            entry["reused"] = max(0, entry["requests"] - entry["connections"])
+    return stats
+
+
+def print_connection_stats():
+    """Prints how often connections were reused, per host."""
+    stats = connection_stats()
+    if not stats:
+        return
+    print("--- HTTP Connection Reuse ---")
+    for host, entry in stats.items():
+        print(f"  {host}: {entry['requests']} requests over {entry['connections']} connections ({entry['reused']} reused)")
+
+
+def close():
+    """Closes the pooled connections."""
+    global session
+    with session_lock:
+        if session is not None:
+            session.close()
+            session = None
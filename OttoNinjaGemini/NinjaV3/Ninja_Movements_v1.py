@@ -27,6 +27,8 @@
 import sys
 import os
 import time
+import heapq
+import functools
 import threading # Added import for threading
 
 # Add parent directory to Python path for library access
@@ -39,31 +41,152 @@ except ImportError:
     print("Error: DFRobot library not found.")
     print("Please install it using: pip install DFRobot_RaspberryPi_Expansion_Board")
     sys.exit(1)
+import Ninja_Bus
+import Ninja_Calibration
+import Ninja_ADC
+
+# --- Configuration ---
+# Per-robot servo offsets/limits; the angles in this file are shared by every robot
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "servo_calibration.json")
+STAND_POSE = (105, 90, 90, 90) # Servo 0-3 angles of the standing position
+POSE_MATCH_TOLERANCE = 10 # Max degrees a servo may be off for the robot to count as "in" a pose
+POSE_HOP_COST = 5 # Extra cost (degrees) per intermediate pose, so direct transitions win ties
+SERVO_IDLE_TIMEOUT = 30.0 # Seconds without a servo command before the servos are powered down (None = never)
+IDLE_CHECK_INTERVAL = 1.0 # Seconds between idle checks
 
 # --- Global Variables ---
 board = None
-servo = None
+servo = None # Ninja_Bus.ServoChannels: every move goes through the bus owner thread
+bus = None # Ninja_Bus.BusOwner: the only thread that talks to the board after init
+adc = None # Ninja_ADC.AdcSampler: battery voltage and the other analog inputs
 # Global flag to stop continuous movements
 stop_movement = False
+# Live parameters of the running continuous movement (see update_movement())
+gait_command = {'direction': None, 'speed': None, 'velocity': None}
+motion_calibration = dict(Ninja_Calibration.DEFAULT_MOTION_CALIBRATION) # Rotation speed and turn step angle
+# Idle power-down: the servos are never relaxed while a gait is running
+active_gaits = 0
+active_gaits_lock = threading.Lock()
+idle_thread = None
 
 # --- Initialization and Status ---
 
-def init_board_and_servo():
-    """Initializes the I2C board and servo controller."""
-    global board, servo
+def init_board_and_servo(attempts=5, base_delay=0.25, max_delay=2.0):
+    """
+    Initializes the I2C board and servo controller.
+    The board connection is retried with exponential backoff (base_delay doubling
+    up to max_delay) for at most `attempts` tries; attempts=None retries forever.
+    Returns True on success, False if the board never answered.
+    """
+    global board, servo, bus, adc, motion_calibration
     board = Board(1, 0x10)  # Select i2c bus 1, set address to 0x10
-    servo = Servo(board)
+    servo = None
 
-    # Loop until board connection is successful
+    attempt = 1
+    delay = base_delay
     while board.begin() != board.STA_OK:
         print_board_status()
-        print("Board connection failed. Retrying in 2 seconds...")
-        time.sleep(2)
+        if attempts is not None and attempt >= attempts:
+            print(f"Board connection failed after {attempt} attempts.")
+            return False
+        print(f"Board connection failed. Retrying in {delay:.2f} seconds...")
+        time.sleep(delay)
+        attempt += 1
+        delay = min(delay * 2, max_delay)
     print("Board connection successful.")
 
+    # From here on all register access is serialized by the bus owner thread
+    bus = Ninja_Bus.BusOwner(board)
+    bus.start()
+    calibration = Ninja_Calibration.load_calibration(CALIBRATION_FILE)
+    tables = Ninja_Calibration.build_servo_tables(calibration)
+    servo = Ninja_Bus.ServoChannels(bus, Servo(board), tables, [entry["speed"] for entry in calibration])
+    motion_calibration = Ninja_Calibration.load_motion_calibration(CALIBRATION_FILE)
+    adc = Ninja_ADC.AdcSampler(bus, Ninja_Calibration.load_battery_calibration(CALIBRATION_FILE))
+    adc.start()
+
     # Initialize servo controller
     servo.begin()
     print("Servo controller initialized.")
+    _start_idle_manager()
+    return True
+
+# --- Idle Power-Down ---
+
+def _start_idle_manager():
+    global idle_thread
+    if SERVO_IDLE_TIMEOUT is None or (idle_thread and idle_thread.is_alive()):
+        return
+    idle_thread = threading.Thread(target=_idle_manager, name="servo-idle", daemon=True)
+    idle_thread.start()
+
+def _idle_manager():
+    """
+    Powers the servos down (duty 0) once nothing has been commanded for SERVO_IDLE_TIMEOUT
+    seconds. The next move restores the last pose (see Ninja_Bus.ServoChannels.wake()).
+    """
+    while servo is not None:
+        time.sleep(IDLE_CHECK_INTERVAL)
+        channels = servo
+        if channels is None or active_gaits or channels.is_relaxed():
+            continue
+        if channels.idle_time() >= SERVO_IDLE_TIMEOUT:
+            print(f"Servos idle for {SERVO_IDLE_TIMEOUT:.0f}s. Powering them down until the next command.")
+            channels.relax()
+
+def _holds_torque(gait_function):
+    """Decorator: the idle manager does not power the servos down while gait_function runs."""
+    @functools.wraps(gait_function)
+    def wrapper(*args, **kwargs):
+        global active_gaits
+        with active_gaits_lock:
+            active_gaits += 1
+        try:
+            return gait_function(*args, **kwargs)
+        finally:
+            with active_gaits_lock:
+                active_gaits -= 1
+    return wrapper
+
+def servos_relaxed():
+    """True if the idle manager has powered the servos down."""
+    return servo is not None and servo.is_relaxed()
+
+def servo_stats():
+    """Per-servo power state, duty cycle, travel and load estimate."""
+    if servo is None:
+        return {}
+    return {
+        "idle_timeout": SERVO_IDLE_TIMEOUT,
+        "idle_seconds": round(servo.idle_time(), 1),
+        "relaxed": servo.is_relaxed(),
+        "servos": servo.usage_stats(),
+    }
+
+def bus_stats():
+    """Returns the I2C bus owner's queue depth, bus time per second and error counters."""
+    return bus.stats() if bus else {}
+
+# --- Battery ---
+
+def battery_speed_scale():
+    """Factor (MIN_SPEED_SCALE..1.0) the gaits scale their speed by while the battery sags."""
+    return adc.speed_scale() if adc else 1.0
+
+def adc_stats():
+    """Filtered battery voltage, sag speed scale and per-channel ADC readings."""
+    return adc.stats() if adc else {}
+
+def shutdown_bus():
+    """Stops the ADC sampler, sends any queued servo writes and stops the bus owner thread."""
+    global bus, servo, adc
+    if adc:
+        adc.stop()
+        adc = None
+    if bus:
+        bus.stop()
+    bus = None
+    servo = None
 
 def print_board_status():
     """Prints the status of the expansion board."""
@@ -107,38 +230,138 @@ def set_all_servos(angle):
     print(f"Moving all servos to {angle} degrees.")
     for i in range(4):
         servo.move(i, angle)
-    time.sleep(0.5) # Give time for all servos to move
+    servo.wait_until_arrived() # Give time for all servos to move
+
+# --- Pose Graph ---
+# Named poses (servo 0-3 angles, None = this servo is not part of the pose) and the
+# transitions that are safe to make directly. go_to_pose() plans the shortest path
+# from wherever the servos are now, so e.g. switching between two tire-mode
+# movements does not stand up and lower again.
+POSES = {
+    'stand': STAND_POSE,
+    'rest': (15, 180, 90, 90), # Lowered, feet neutral
+    'tire': (15, 180, None, None), # Lowered, feet are driven as wheels
+    'lift_right': (70, 90, 90, 90), # Mid-gait: right leg lifted
+    'lift_left': (105, 125, 90, 90), # Mid-gait: left leg lifted
+}
+POSE_EDGES = (
+    ('stand', 'rest'),
+    ('stand', 'tire'),
+    ('tire', 'rest'),
+    ('stand', 'lift_right'),
+    ('stand', 'lift_left'),
+)
+# Pose each movement starts from; anything not listed starts standing
+ENTRY_POSES = {
+    'run': 'tire',
+    'runback': 'tire',
+    'rotateleft': 'tire',
+    'rotateright': 'tire',
+    'drive': 'tire',
+    'rest': 'rest',
+}
+
+def _pose_distance(a, b):
+    """Largest single-servo angle change between two poses (servos either side leaves free are ignored)."""
+    return max((abs(x - y) for x, y in zip(a, b) if x is not None and y is not None), default=0)
+
+def _build_pose_graph():
+    graph = {name: {} for name in POSES}
+    for a, b in POSE_EDGES:
+        cost = _pose_distance(POSES[a], POSES[b]) + POSE_HOP_COST
+        graph[a][b] = cost
+        graph[b][a] = cost
+    return graph
+
+POSE_GRAPH = _build_pose_graph()
+
+def entry_pose(move_name):
+    """Name of the pose a movement starts from."""
+    return ENTRY_POSES.get(move_name, 'stand')
+
+def current_pose():
+    """
+    Name of the pose the servos were last commanded into (within POSE_MATCH_TOLERANCE),
+    or None if they are somewhere else (e.g. after set_servo_angle).
+    """
+    if servo is None: return None
+    angles = [servo.target_angle(i) for i in range(4)]
+    if None in angles: return None
+    best, best_distance = None, POSE_MATCH_TOLERANCE + 1
+    for name, pose in POSES.items():
+        distance = _pose_distance(angles, pose)
+        if distance < best_distance:
+            best, best_distance = name, distance
+    return best
+
+def plan_transition(start, target):
+    """
+    Shortest list of poses (Dijkstra over POSE_GRAPH) leading from pose `start`
+    to pose `target`, excluding start. An unknown start goes straight to target.
+    """
+    if start not in POSE_GRAPH:
+        return [target]
+    costs = {start: 0}
+    previous = {}
+    queue = [(0, start)]
+    while queue:
+        cost, name = heapq.heappop(queue)
+        if name == target:
+            break
+        if cost > costs[name]:
+            continue
+        for neighbour, edge_cost in POSE_GRAPH[name].items():
+            new_cost = cost + edge_cost
+            if new_cost < costs.get(neighbour, float('inf')):
+                costs[neighbour] = new_cost
+                previous[neighbour] = name
+                heapq.heappush(queue, (new_cost, neighbour))
+    if target not in costs:
+        return [target]
+    path = [target]
+    while path[-1] != start:
+        path.append(previous[path[-1]])
+    path.reverse()
+    return path[1:] or [target]
+
+def _apply_pose(name, priority=Ninja_Bus.PRIORITY_NORMAL):
+    for servo_id, angle in enumerate(POSES[name]):
+        if angle is not None:
+            servo.move(servo_id, angle, priority)
+
+def go_to_pose(name, priority=Ninja_Bus.PRIORITY_NORMAL):
+    """Moves to a named pose along the planned path, returning once the servos have arrived."""
+    if servo is None: return
+    start = current_pose()
+    if start is not None and _pose_distance([servo.target_angle(i) for i in range(4)], POSES[name]) <= POSE_MATCH_TOLERANCE:
+        start = name # Already there (a pose may match more than one name, e.g. rest and tire)
+    path = plan_transition(start, name)
+    if len(path) > 1 or start != name:
+        print(f"Pose transition: {start or 'unknown'} -> {' -> '.join(path)}")
+    for pose in path:
+        _apply_pose(pose, priority)
+        servo.wait_until_arrived()
 
 # --- Predefined Poses ---
 
-"""Resets all servos to the initial standing position.
-   Adjust the angles below to match your robot's stable stand.
+"""Resets all servos to the initial standing position (STAND_POSE).
+   If your robot does not stand straight, adjust the servo offsets in
+   servo_calibration.json rather than these angles.
    Servo 0: Right Leg/Hip? -> 105 degrees
    Servo 1: Left Leg/Hip?  -> 90 degrees
    Servo 2: Right Foot/Ankle?-> 90 degrees
    Servo 3: Left Foot/Ankle? -> 90 degrees
 """
-def reset_servos():
+def reset_servos(priority=Ninja_Bus.PRIORITY_NORMAL):
     if servo is None: return
     print("Resetting servos to standing position.")
-    servo.move(0, 105)
-    servo.move(1, 90)
-    servo.move(2, 90)
-    servo.move(3, 90)
-    time.sleep(0.5)  # Short delay for the servos to reach the position
+    go_to_pose('stand', priority) # Only as long as the planned moves need
 
 """ Lowers the robot into a resting or 'tire' mode configuration. """
 def rest():
     if servo is None: return
     print("Moving servos to resting position.")
-    # Optionally reset to stand first for a smoother transition
-    # reset_servos()
-    # time.sleep(0.2)
-    servo.move(0, 15)   # Lower right leg
-    servo.move(1, 180)  # Lower left leg (adjust angle if 180 is too extreme)
-    servo.move(2, 90)   # Neutral feet
-    servo.move(3, 90)
-    time.sleep(1) # Allow time to settle
+    go_to_pose('rest') # Legs lowered (right 15, left 180), feet neutral
 
 # --- Predefined Actions ---
 
@@ -146,7 +369,7 @@ def rest():
 def hello():
     if servo is None: return
     print("Performing 'hello' action.")
-    reset_servos() # Start from stand
+    go_to_pose('stand') # Start from stand
     servo.move(0, 175)
     servo.move(1, 135)
     time.sleep(1)
@@ -166,9 +389,50 @@ def hello():
 
 # --- Continuous Movements (Use with threading) ---
 # Note: The 'style' parameter is currently unused but kept for future expansion.
+# The running gait reads gait_command at every phase boundary, so update_movement()
+# can change its speed or direction without stopping it.
+
+# name -> (gait, direction). Movements of the same gait can be switched live.
+GAITS = {
+    'walk': ('walk', 'forward'),
+    'stepback': ('walk', 'backward'),
+    'run': ('tire', 'forward'),
+    'runback': ('tire', 'backward'),
+    'rotateleft': ('tire', 'left'),
+    'rotateright': ('tire', 'right'),
+    'drive': ('tire', None), # Velocity from set_drive(); not offered to Gemini (see MOVEMENTS)
+}
+GAIT_BLEND_FRACTION = 0.5 # Share of a speed change applied per phase (crossfade over a few phases)
+
+def set_gait_command(direction, speed, velocity=None):
+    """
+    Sets the direction and speed the running gait picks up at its next phase boundary.
+    velocity: (linear, angular) for tire mode, overrides direction and speed.
+    """
+    gait_command['direction'] = direction
+    gait_command['speed'] = speed
+    gait_command['velocity'] = velocity
+
+def can_update_movement(current_name, new_name):
+    """True if new_name can be applied to the running current_name movement without stopping it."""
+    return current_name in GAITS and new_name in GAITS and GAITS[current_name][0] == GAITS[new_name][0]
+
+def update_movement(move_name, speed=None):
+    """Switches the running gait to move_name's direction and the given speed."""
+    direction = GAITS[move_name][1]
+    print(f"Updating movement: {move_name} (Speed: {speed or 'normal'})")
+    set_gait_command(direction, speed)
+
+def _blend(current, target):
+    """Moves each parameter GAIT_BLEND_FRACTION of the way to its target (snaps when close)."""
+    blended = []
+    for c, t in zip(current, target):
+        value = c + (t - c) * GAIT_BLEND_FRACTION
+        blended.append(t if abs(t - value) < 0.01 else value)
+    return tuple(blended)
 
 def _get_walk_params(speed):
-    """Helper to get timing parameters based on speed."""
+    """Helper to get timing parameters based on speed (stretched while the battery sags)."""
     if speed == 'fast':
         step_delay = 0.15 # Shorter delay between steps
         foot_rotate_delay = 0.3
@@ -181,138 +445,96 @@ def _get_walk_params(speed):
         step_delay = 0.25
         foot_rotate_delay = 0.5
         lift_angle_adj = 0
-    return step_delay, foot_rotate_delay, lift_angle_adj
-
-"""Walk forward continuously, alternating legs."""
-def walk(speed=None, style=None):
+    scale = battery_speed_scale()
+    return step_delay / scale, foot_rotate_delay / scale, lift_angle_adj
+
+"""Walks in gait_command's direction until stop(), one leg per phase.
+   Speed changes are blended in at every leg phase; a direction change
+   waits for the end of the cycle, when both legs are down.
+   steps / duration (seconds) end the walk by itself, standing, after that many
+   leg steps or the first step boundary past the duration."""
+@_holds_torque
+def _walk_gait(name, direction, speed, steps=None, duration=None):
     global stop_movement
     if servo is None: return
-    print(f"Starting walk (Speed: {speed or 'normal'}). Use stop() to halt.")
-    step_delay, foot_rotate_delay, lift_adj = _get_walk_params(speed)
+    set_gait_command(direction, speed)
+    step_delay, foot_rotate_delay, lift_adj = params = _get_walk_params(speed)
     stand_right_leg = 105
     stand_left_leg = 90
     lift_right_leg = 70 # Adjusted lift angle
     lift_left_leg = 125 # Adjusted lift angle
-
-    while not stop_movement:
-        # Step 1: Lift Right Leg
-        servo.move(0, lift_right_leg + lift_adj)
-        time.sleep(step_delay)
-        if stop_movement: break
-
-        # Step 2: Rotate feet to shift weight/turn slightly
-        servo.move(2, 80) # Right foot rotate
-        servo.move(3, 100)# Left foot rotate
-        time.sleep(foot_rotate_delay)
-        servo.move(2, 90) # Feet back to neutral
-        servo.move(3, 90)
-        if stop_movement: break
-
-        # Step 3: Place Right Leg Down
-        servo.move(0, stand_right_leg)
-        time.sleep(step_delay)
-        if stop_movement: break
-
-        # Step 4: Lift Left Leg
-        servo.move(1, lift_left_leg - lift_adj) # Note the subtraction if lift_adj is positive
-        time.sleep(step_delay)
-        if stop_movement: break
-
-        # Step 5: Rotate feet
-        servo.move(2, 80)
-        servo.move(3, 100)
-        time.sleep(foot_rotate_delay)
-        servo.move(2, 90)
-        servo.move(3, 90)
-        if stop_movement: break
-
-        # Step 6: Place Left Leg Down
-        servo.move(1, stand_left_leg)
-        time.sleep(step_delay)
+    go_to_pose('stand')
+    deadline = time.monotonic() + duration if duration else None
+    steps_done = 0
+
+    while not stop_movement and not _bound_reached(steps_done, steps, deadline):
+        direction = gait_command['direction']
+        # Forward leads with the right leg, backward with the left; the feet rotate the other way round
+        if direction == 'backward':
+            legs = ((1, stand_left_leg, lift_left_leg, -1), (0, stand_right_leg, lift_right_leg, 1))
+            right_foot, left_foot = 100, 80
+        else:
+            legs = ((0, stand_right_leg, lift_right_leg, 1), (1, stand_left_leg, lift_left_leg, -1))
+            right_foot, left_foot = 80, 100
+
+        for leg, stand_angle, lift_angle, lift_sign in legs:
+            if _bound_reached(steps_done, steps, deadline): break
+            # Phase boundary: move part of the way towards the latest speed
+            params = _blend(params, _get_walk_params(gait_command['speed']))
+            step_delay, foot_rotate_delay, lift_adj = params
+
+            # Lift leg (lift_adj is added to the right leg angle, subtracted from the left)
+            servo.move(leg, lift_angle + lift_sign * lift_adj)
+            time.sleep(step_delay)
+            if stop_movement: break
+
+            # Rotate feet to shift weight
+            servo.move(2, right_foot)
+            servo.move(3, left_foot)
+            time.sleep(foot_rotate_delay)
+            servo.move(2, 90) # Feet back to neutral
+            servo.move(3, 90)
+            if stop_movement: break
+
+            # Place leg down
+            servo.move(leg, stand_angle)
+            time.sleep(step_delay)
+            steps_done += 1
+            if stop_movement: break
         # Loop repeats
 
-    print("Walk stopped.")
-    if stop_movement: # Check if stopped by command vs end of sequence (if applicable)
-        reset_servos()
-
-"""Walk backward continuously, alternating legs."""
-def stepback(speed=None, style=None):
-    global stop_movement
-    if servo is None: return
-    print(f"Starting step back (Speed: {speed or 'normal'}). Use stop() to halt.")
-    step_delay, foot_rotate_delay, lift_adj = _get_walk_params(speed)
-    stand_right_leg = 105
-    stand_left_leg = 90
-    lift_right_leg = 70
-    lift_left_leg = 125
-
-    # --- Optional Distance Sensor Check ---
-    # Define measure_distance() elsewhere if using a sensor
-    # try:
-    #     from your_sensor_module import measure_distance # Example import
-    # except ImportError:
-    #     measure_distance = None
-    # ---
-
-    while not stop_movement:
-        # --- Optional Distance Check ---
-        # if measure_distance:
-        #     distance = measure_distance()
-        #     if distance != -1 and distance < 10: # Check distance (e.g., 10 cm)
-        #         print("Object detected close behind! Stopping stepback.")
-        #         stop() # This will set stop_movement = True and break the loop
-        #         break
-        # ---
-
-        # Step 1: Lift Left Leg
-        servo.move(1, lift_left_leg - lift_adj)
-        time.sleep(step_delay)
-        if stop_movement: break
-
-        # Step 2: Rotate feet (opposite for backward move)
-        servo.move(2, 100) # Right foot rotate
-        servo.move(3, 80)  # Left foot rotate
-        time.sleep(foot_rotate_delay)
-        servo.move(2, 90) # Feet back to neutral
-        servo.move(3, 90)
-        if stop_movement: break
-
-        # Step 3: Place Left Leg Down
-        servo.move(1, stand_left_leg)
-        time.sleep(step_delay)
-        if stop_movement: break
-
-        # Step 4: Lift Right Leg
-        servo.move(0, lift_right_leg + lift_adj)
-        time.sleep(step_delay)
-        if stop_movement: break
+    if stop_movement:
+        print(f"{name} stopped.") # stop() settles into the next movement's entry pose
+    else:
+        print(f"{name} finished after {steps_done} steps.")
 
-        # Step 5: Rotate feet
-        servo.move(2, 100)
-        servo.move(3, 80)
-        time.sleep(foot_rotate_delay)
-        servo.move(2, 90)
-        servo.move(3, 90)
-        if stop_movement: break
+def _bound_reached(count, limit, deadline):
+    """True once a bounded movement has done `limit` repetitions or passed its deadline."""
+    return (limit is not None and count >= limit) or (deadline is not None and time.monotonic() >= deadline)
 
-        # Step 6: Place Right Leg Down
-        servo.move(0, stand_right_leg)
-        time.sleep(step_delay)
-        # Loop repeats
+"""Walk forward, alternating legs: continuously, or for `steps` steps / `duration` seconds."""
+def walk(speed=None, style=None, steps=None, duration=None):
+    print(f"Starting walk (Speed: {speed or 'normal'}). Use stop() to halt.")
+    _walk_gait("Walk", 'forward', speed, steps, duration)
 
-    print("Step back stopped.")
-    if stop_movement:
-        reset_servos()
+"""Walk backward, alternating legs: continuously, or for `steps` steps / `duration` seconds."""
+def stepback(speed=None, style=None, steps=None, duration=None):
+    print(f"Starting step back (Speed: {speed or 'normal'}). Use stop() to halt.")
+    _walk_gait("Step back", 'backward', speed, steps, duration)
 
 
-"""Performs *one step* of turning the robot left."""
-# For continuous turning, call this repeatedly or modify it with a loop.
-def turnleft_step(speed=None, style=None):
+"""Performs *one step* of turning the robot left (or `steps` steps, or as many as turn `degrees`)."""
+def turnleft_step(speed=None, style=None, steps=None, degrees=None):
     if servo is None: return
+    steps = _turn_step_count(steps, degrees)
+    if steps > 1:
+        _repeat_step(turnleft_step, steps, speed)
+        return
     print(f"Performing one turn-left step (Speed: {speed or 'normal'}).")
     step_delay, foot_rotate_delay, lift_adj = _get_walk_params(speed)
     stand_right_leg = 105
     lift_right_leg = 70
+    go_to_pose('stand')
 
     # Lift Right Leg
     servo.move(0, lift_right_leg + lift_adj)
@@ -331,14 +553,18 @@ def turnleft_step(speed=None, style=None):
     # Optional: Shift weight slightly?
     # reset_servos() # Uncomment if you want it to return fully to stand after one step
 
-"""Performs *one step* of turning the robot right."""
-# For continuous turning, call this repeatedly or modify it with a loop.
-def turnright_step(speed=None, style=None):
+"""Performs *one step* of turning the robot right (or `steps` steps, or as many as turn `degrees`)."""
+def turnright_step(speed=None, style=None, steps=None, degrees=None):
     if servo is None: return
+    steps = _turn_step_count(steps, degrees)
+    if steps > 1:
+        _repeat_step(turnright_step, steps, speed)
+        return
     print(f"Performing one turn-right step (Speed: {speed or 'normal'}).")
     step_delay, foot_rotate_delay, lift_adj = _get_walk_params(speed)
     stand_left_leg = 90
     lift_left_leg = 125
+    go_to_pose('stand')
 
     # Lift Left Leg
     servo.move(1, lift_left_leg - lift_adj)
@@ -358,6 +584,21 @@ def turnright_step(speed=None, style=None):
     # reset_servos() # Uncomment if you want it to return fully to stand after one step
 
 
+def _turn_step_count(steps, degrees):
+    """Number of turn steps for a step count or a calibrated angle (at least one)."""
+    if degrees is not None:
+        steps = round(degrees / motion_calibration["turn_step_angle"])
+    return max(1, int(steps or 1))
+
+@_holds_torque
+def _repeat_step(step_function, steps, speed):
+    """Runs a single-step movement `steps` times; stop() ends it after the current step."""
+    print(f"Performing {steps} x {step_function.__name__} (Speed: {speed or 'normal'}).")
+    for _ in range(steps):
+        if stop_movement: break
+        step_function(speed)
+
+
 def _get_run_params(speed):
     """Helper to get run parameters based on speed."""
     # For standard servos (0-180), speed control in 'run' mode
@@ -377,147 +618,167 @@ def _get_run_params(speed):
         angle_offset = 25 # e.g., 90+25=115, 90-25=65
     return angle_offset
 
-"""Change to the 'tire' mode, and move forward continuously."""
-def run(speed=None, style=None):
+# --- Differential Drive (tire mode) ---
+# Every tire movement is a (linear, angular) velocity, each in [-1, 1]:
+# linear > 0 drives forward, angular > 0 rotates counter-clockwise (left).
+# Right wheel CW (<90) and left wheel CCW (>90) both drive forward.
+TIRE_DIRECTIONS = {
+    'forward': (1, 0),
+    'backward': (-1, 0),
+    'left': (0, 1), # Right wheel backward, left wheel forward (CCW)
+    'right': (0, -1), # Right wheel forward, left wheel backward (CW)
+}
+DRIVE_MAX_OFFSET = 40 # Wheel angle offset from 90 at full velocity (the 'fast' preset)
+DRIVE_DEADBAND = 0.05 # Velocities closer to 0 than this are treated as 0 (joystick noise)
+WHEEL_RAMP_RATE = 200.0 # Max change of a wheel angle when the velocity changes (degrees per second)
+WHEEL_TICK = 0.02 # Wheel command interval (seconds): velocity updates are applied at up to 50 Hz
+DRIVE_PARK_TIMEOUT = 2.0 # Seconds drive() may sit at zero velocity before it ends (still in tire mode), so the servos can idle
+
+def wheel_angles(linear, angular):
+    """Maps a (linear, angular) velocity in [-1, 1] to (right wheel, left wheel) servo angles."""
+    linear, angular = (0.0 if abs(v) < DRIVE_DEADBAND else max(-1.0, min(1.0, v)) for v in (linear, angular))
+    right, left = linear - angular, linear + angular # Forward speed of each wheel
+    scale = max(1.0, abs(right), abs(left)) # Keep the turn ratio when a wheel saturates
+    return (90 - DRIVE_MAX_OFFSET * right / scale, 90 + DRIVE_MAX_OFFSET * left / scale)
+
+def _preset_velocity(direction, speed):
+    """(linear, angular) of a named tire movement at a speed preset."""
+    magnitude = _get_run_params(speed) / DRIVE_MAX_OFFSET
+    linear, angular = TIRE_DIRECTIONS[direction]
+    return (linear * magnitude, angular * magnitude)
+
+def set_drive(linear, angular):
+    """Sets the velocity of the running tire gait; it is applied at the next wheel tick."""
+    gait_command['velocity'] = (float(linear), float(angular))
+
+"""Drives the wheels in tire mode until stop() (or for `duration` seconds). Every tick is
+   a phase boundary: speed, direction or velocity changes ramp the wheel angles.
+   A drive() whose velocity has been 0 for DRIVE_PARK_TIMEOUT ends by itself."""
+@_holds_torque
+def _tire_gait(name, direction, speed, velocity=None, duration=None):
     global stop_movement
     if servo is None: return
-    print(f"Starting run forward (Speed: {speed or 'normal'}). Use stop() to halt.")
-    angle_offset = _get_run_params(speed)
+    set_gait_command(direction, speed, velocity)
+    # Lower into run configuration (no-op if already in tire mode)
+    go_to_pose('tire') # Legs down before the wheels turn
+    wheels = None
+    ramp_step = WHEEL_RAMP_RATE * WHEEL_TICK
+    deadline = time.monotonic() + duration if duration else None
+    parked_since = None
+
+    while not stop_movement and not _bound_reached(0, None, deadline):
+        velocity = gait_command['velocity'] or _preset_velocity(gait_command['direction'], gait_command['speed'])
+        scale = battery_speed_scale()
+        # Whole degrees (the LUT's resolution): a slowly sagging battery only causes a write when an angle really changes
+        target = tuple(round(angle) for angle in wheel_angles(velocity[0] * scale, velocity[1] * scale))
+        if wheels is None:
+            new_wheels = target # Start at full speed, like before
+        else:
+            new_wheels = tuple(t if abs(t - w) <= ramp_step else w + (ramp_step if t > w else -ramp_step) for w, t in zip(wheels, target))
+        if new_wheels != wheels: # Holding a velocity costs no bus traffic
+            wheels = new_wheels
+            servo.move(2, wheels[0])
+            servo.move(3, wheels[1])
+        if gait_command['velocity'] is not None and wheels == (90, 90):
+            parked_since = parked_since or time.monotonic()
+            if time.monotonic() - parked_since >= DRIVE_PARK_TIMEOUT:
+                break # Stick released: stop holding the gait (and torque) open
+        else:
+            parked_since = None
+        time.sleep(WHEEL_TICK)
+
+    print(f"{name} {'stopped' if stop_movement else 'finished'}.")
+    # Stop wheels
+    servo.move(2, 90)
+    servo.move(3, 90)
+    servo.wait_until_arrived([2, 3])
+    # stop() moves on to the next movement's entry pose (stays lowered for tire moves)
 
-    # Lower into run configuration
-    servo.move(0, 15)
-    servo.move(1, 180) # Adjust if 180 is too extreme
-    time.sleep(0.5)
+"""Tire mode with a live (linear, angular) velocity, see set_drive()."""
+def drive(linear=0.0, angular=0.0):
+    print(f"Starting drive (linear {linear:+.2f}, angular {angular:+.2f}). Use stop() to halt.")
+    _tire_gait("Drive", None, None, (linear, angular))
 
-    # Assuming servo 2 is right wheel/foot, servo 3 is left wheel/foot
-    # Forward: Right wheel CW (angle < 90), Left wheel CCW (angle > 90)
-    right_wheel_angle = 90 - angle_offset
-    left_wheel_angle = 90 + angle_offset
+def rotation_duration(degrees, speed=None):
+    """Seconds a tire-mode rotation at a speed preset takes to turn `degrees` (from the motion calibration, at the current battery speed scale)."""
+    _, angular = _preset_velocity('left', speed)
+    return abs(degrees) / (motion_calibration["rotation_speed"] * angular * battery_speed_scale())
 
-    while not stop_movement:
-        servo.move(2, right_wheel_angle)
-        servo.move(3, left_wheel_angle)
-        # Need a small delay or the loop will be too fast, adjust as needed
-        time.sleep(0.05)
+"""Change to the 'tire' mode, and move forward continuously (or for `duration` seconds)."""
+def run(speed=None, style=None, duration=None):
+    print(f"Starting run forward (Speed: {speed or 'normal'}). Use stop() to halt.")
+    _tire_gait("Run forward", 'forward', speed, duration=duration)
 
-    print("Run forward stopped.")
-    if stop_movement:
-        # Stop wheels
-        servo.move(2, 90)
-        servo.move(3, 90)
-        time.sleep(0.2)
-        # Return to standing or resting position
-        reset_servos() # Or call rest()
-
-"""Change to the 'tire' mode, and move backward continuously."""
-def runback(speed=None, style=None):
-    global stop_movement
-    if servo is None: return
+"""Change to the 'tire' mode, and move backward continuously (or for `duration` seconds)."""
+def runback(speed=None, style=None, duration=None):
     print(f"Starting run backward (Speed: {speed or 'normal'}). Use stop() to halt.")
-    angle_offset = _get_run_params(speed)
-
-    # Lower into run configuration
-    servo.move(0, 15)
-    servo.move(1, 180)
-    time.sleep(0.5)
-
-    # Backward: Right wheel CCW (angle > 90), Left wheel CW (angle < 90)
-    right_wheel_angle = 90 + angle_offset
-    left_wheel_angle = 90 - angle_offset
-
-    while not stop_movement:
-        servo.move(2, right_wheel_angle)
-        servo.move(3, left_wheel_angle)
-        time.sleep(0.05) # Adjust delay as needed
-
-    print("Run backward stopped.")
-    if stop_movement:
-        servo.move(2, 90)
-        servo.move(3, 90)
-        time.sleep(0.2)
-        reset_servos()
+    _tire_gait("Run backward", 'backward', speed, duration=duration)
 
-"""Change to the 'tire' mode, and rotate counter-clockwise (left) continuously."""
-def rotateleft(speed=None, style=None):
-    global stop_movement
-    if servo is None: return
+"""Change to the 'tire' mode, and rotate counter-clockwise (left) continuously, or by `degrees`."""
+def rotateleft(speed=None, style=None, degrees=None, duration=None):
+    if degrees is not None:
+        duration = rotation_duration(degrees, speed)
     print(f"Starting rotate left (CCW) (Speed: {speed or 'normal'}). Use stop() to halt.")
-    angle_offset = _get_run_params(speed)
-
-    servo.move(0, 15)
-    servo.move(1, 180)
-    time.sleep(0.5)
-
-    # Rotate Left (CCW): Both wheels forward -> Right CW (<90), Left CCW (>90)
-    # Wait, rotate left should be Right forward, Left backward
-    # Right wheel CW (<90), Left wheel CW (<90) ?? No, that's moving right arc
-    # Rotate Left: Right wheel FORWARD (CW, <90), Left wheel BACKWARD (CW, <90)? -> NO
-    # Rotate Left: Right wheel FORWARD (CW, <90), Left wheel BACKWARD (CCW, >90)? -> NO
-    # Rotate Left: Right wheel FORWARD (CW, <90), Left wheel FORWARD (CCW, >90) -> This is RUN FWD
-    # Rotate Left: Right wheel BACKWARD (CCW, >90), Left wheel FORWARD (CCW, >90) -> YES!
-
-    right_wheel_angle = 90 + angle_offset # Backward
-    left_wheel_angle = 90 + angle_offset  # Forward
-
-    while not stop_movement:
-        servo.move(2, right_wheel_angle)
-        servo.move(3, left_wheel_angle)
-        time.sleep(0.05)
-
-    print("Rotate left stopped.")
-    if stop_movement:
-        servo.move(2, 90)
-        servo.move(3, 90)
-        time.sleep(0.2)
-        reset_servos()
-
+    _tire_gait("Rotate left", 'left', speed, duration=duration)
 
-"""Change to the 'tire' mode, and rotate clockwise (right) continuously."""
-def rotateright(speed=None, style=None):
-    global stop_movement
-    if servo is None: return
+"""Change to the 'tire' mode, and rotate clockwise (right) continuously, or by `degrees`."""
+def rotateright(speed=None, style=None, degrees=None, duration=None):
+    if degrees is not None:
+        duration = rotation_duration(degrees, speed)
     print(f"Starting rotate right (CW) (Speed: {speed or 'normal'}). Use stop() to halt.")
-    angle_offset = _get_run_params(speed)
-
-    servo.move(0, 15)
-    servo.move(1, 180)
-    time.sleep(0.5)
-
-    # Rotate Right (CW): Right wheel BACKWARD (CCW, >90), Left wheel FORWARD (CCW, >90) -> NO Left forward is CCW
-    # Rotate Right (CW): Right wheel FORWARD (CW, <90), Left wheel BACKWARD (CW, <90)? -> YES!
-
-    right_wheel_angle = 90 - angle_offset # Forward
-    left_wheel_angle = 90 - angle_offset  # Backward
-
-    while not stop_movement:
-        servo.move(2, right_wheel_angle)
-        servo.move(3, left_wheel_angle)
-        time.sleep(0.05)
-
-    print("Rotate right stopped.")
-    if stop_movement:
-        servo.move(2, 90)
-        servo.move(3, 90)
-        time.sleep(0.2)
-        reset_servos()
+    _tire_gait("Rotate right", 'right', speed, duration=duration)
+
+
+# --- Movement Registry ---
+# name -> (kind, description). ninja_core builds its Gemini prompt and its
+# continuous/finite dispatch from this table, so keep it in sync with the
+# functions above. Kinds:
+#   'continuous': runs in a thread until stop(), accepts a speed
+#   'step':       finite movement, accepts a speed
+#   'pose':       finite movement, no arguments
+#   'control':    stop() and friends
+MOVEMENTS = {
+    'hello': ('pose', "A specific wave/wiggle sequence."),
+    'walk': ('continuous', "Continuous forward walking."),
+    'stepback': ('continuous', "Continuous backward walking."),
+    'run': ('continuous', "Continuous forward running (tire mode)."),
+    'runback': ('continuous', "Continuous backward running (tire mode)."),
+    'turnleft_step': ('step', "Perform ONE step turning left."),
+    'turnright_step': ('step', "Perform ONE step turning right."),
+    'rotateleft': ('continuous', "Continuous counter-clockwise rotation (tire mode)."),
+    'rotateright': ('continuous', "Continuous clockwise rotation (tire mode)."),
+    'stop': ('control', "Stop any ongoing continuous movement."),
+    'reset_servos': ('pose', "Return to standard standing position."),
+    'rest': ('pose', "Go to lowered resting position."),
+}
+SPEEDS = ('normal', 'fast', 'slow')
+CONTINUOUS_MOVEMENTS = tuple(name for name, (kind, _) in MOVEMENTS.items() if kind == 'continuous')
+# Optional bounds (keyword arguments) -> movements that accept them. A bounded
+# movement ends by itself: after `steps` steps, `degrees` of rotation or `duration` seconds.
+BOUNDED_MOVEMENTS = {
+    'steps': ('walk', 'stepback', 'turnleft_step', 'turnright_step'),
+    'degrees': ('rotateleft', 'rotateright', 'turnleft_step', 'turnright_step'),
+    'duration': CONTINUOUS_MOVEMENTS,
+}
 
 
 # --- Control Functions ---
 
-"""Stops any continuous movement and resets servos to standing position."""
-def stop():
+"""Stops any continuous movement and settles into settle_pose (default: standing).
+   Pass the next movement's entry_pose() to skip needless transitions, e.g. between tire moves."""
+def stop(settle_pose='stand'):
     global stop_movement
     print("Stopping continuous movement...")
+    # Signal the threads, then stop the wheels/feet ahead of any queued gait writes
     stop_movement = True
+    if servo:
+        servo.move(2, 90, Ninja_Bus.PRIORITY_STOP)
+        servo.move(3, 90, Ninja_Bus.PRIORITY_STOP)
     # Give threads a moment to see the flag
     time.sleep(0.1)
-    # Ensure wheels/feet are stopped if in run mode (redundant if reset_servos() is called)
-    if servo:
-        servo.move(2, 90)
-        servo.move(3, 90)
-    # Reset to a known stable state
-    reset_servos()
-    print("Movement stopped and servos reset.")
+    # Settle into a known stable state
+    go_to_pose(settle_pose, Ninja_Bus.PRIORITY_STOP)
+    print(f"Movement stopped ({settle_pose}).")
 
 
 def start_continuous_movement(movement_func, speed = None, style = None):
@@ -529,7 +790,7 @@ def start_continuous_movement(movement_func, speed = None, style = None):
 
     # Ensure any previous movement thread is stopped conceptually
     # (The actual thread termination depends on the thread seeing stop_movement)
-    stop() # Reset flag and position before starting new move
+    stop(settle_pose=entry_pose(movement_func.__name__)) # Reset flag and position before starting new move
     time.sleep(0.1) # Short delay
     stop_movement = False # Reset flag for the new movement
 
@@ -547,7 +808,7 @@ def start_continuous_movement(movement_func, speed = None, style = None):
 if __name__ == "__main__":
     movement_thread = None
     try:
-        init_board_and_servo()
+        init_board_and_servo(attempts=None) # Interactive test: wait for the board indefinitely
         reset_servos() # Start in a known position
 
         print("\n--- Robot Movement Test ---")
@@ -0,0 +1,201 @@
+# -*- coding:utf-8 -*-
+
+'''!
+  @file Ninja_Speech.py
+  @brief Pluggable speech recognition backends for Ninja_Voice_Control.
+  @n CloudSpeech: SpeechRecognition's listen() plus a cloud transcription function.
+  @n VoskSpeech:  on-device recognition, constrained to the command grammar and streamed,
+  @n              so partial results (e.g. "stop") can act before the utterance ends.
+  @n HybridSpeech: Vosk for commands, the cloud for open questions and anything Vosk
+  @n              could not match to the grammar.
+  @license The MIT License (MIT)
+'''
+
+import os
+import abc
+import json
+import time
+import audioop # Same energy measure as SpeechRecognition's listen()
+import collections
+import speech_recognition as sr
+
+try:
+    import vosk
+    vosk.SetLogLevel(-1) # Keep Kaldi's model-loading chatter off the console
+    vosk_available = True
+except ImportError:
+    vosk_available = False
+
+# --- Configuration ---
+UNKNOWN_WORD = "[unk]" # What a grammar-constrained Vosk recognizer returns for other words
+PRE_ROLL_SECONDS = 0.5 # Audio kept from before speech starts (for the cloud fallback)
+
+# --- Backends ---
+
+class SpeechBackend(abc.ABC):
+    """
+    Interface: recognize() listens on an open microphone source and returns the transcript.
+    on_partial(text) is called with interim results by streaming backends; returning True
+    ends the utterance right away. Raises sr.WaitTimeoutError, sr.UnknownValueError or
+    sr.RequestError like SpeechRecognition does.
+    """
+    name = "base"
+
+    def set_grammar(self, phrases, wake_word=None):
+        """
+        Restricts recognition to these phrases, if the backend supports it.
+        wake_word: the word commands start with (tells commands from questions).
+        """
+
+    @abc.abstractmethod
+    def recognize(self, source, timeout, phrase_time_limit, on_partial=None):
+        """Listens for one utterance and returns its transcript."""
+
+
+class CloudSpeech(SpeechBackend):
+    """Record with SpeechRecognition, then transcribe in the cloud (no partial results)."""
+    name = "cloud"
+
+    def __init__(self, recognizer, transcribe):
+        self.recognizer = recognizer
+        self.transcribe = transcribe # Function: sr.AudioData -> transcript
+
+    def recognize(self, source, timeout, phrase_time_limit, on_partial=None):
+        audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+        print("Got audio, recognizing...")
+        return self.transcribe(audio)
+
+
+class VoskSpeech(SpeechBackend):
+    """On-device streaming recognition with a Vosk model."""
+    name = "vosk"
+
+    def __init__(self, model_path, recognizer=None):
+        start_time = time.monotonic()
+        self.model = vosk.Model(model_path)
+        self.recognizer = recognizer # sr.Recognizer: its calibrated energy_threshold marks the start of speech
+        self.grammar = None # JSON phrase list, None = full vocabulary
+        self.last_audio = None # sr.AudioData of the last utterance (for a cloud retry)
+        print(f"Vosk model loaded from {model_path} in {time.monotonic() - start_time:.2f}s.")
+
+    def set_grammar(self, phrases, wake_word=None):
+        self.grammar = json.dumps(list(phrases) + [UNKNOWN_WORD])
+
+    def recognize(self, source, timeout, phrase_time_limit, on_partial=None):
+        if self.grammar:
+            recognizer = vosk.KaldiRecognizer(self.model, source.SAMPLE_RATE, self.grammar)
+        else:
+            recognizer = vosk.KaldiRecognizer(self.model, source.SAMPLE_RATE)
+        chunk_seconds = source.CHUNK / source.SAMPLE_RATE
+        # Before speech starts only a short pre-roll is kept; after that, everything
+        frames = collections.deque(maxlen=max(1, int(PRE_ROLL_SECONDS / chunk_seconds)))
+        start_time = time.monotonic()
+        speech_start = None
+        last_partial = ""
+        text = ""
+
+        while True:
+            data = source.stream.read(source.CHUNK)
+            frames.append(data)
+            now = time.monotonic()
+            if speech_start is None and self._is_loud(data, source):
+                speech_start = now
+                frames = collections.deque(frames) # Stop trimming: keep the whole utterance
+
+            if recognizer.AcceptWaveform(data):
+                text = json.loads(recognizer.Result()).get("text", "")
+                if text:
+                    break # End of utterance
+            else:
+                partial = json.loads(recognizer.PartialResult()).get("partial", "")
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    if speech_start is None: # Speech quieter than the energy threshold
+                        speech_start = now
+                        frames = collections.deque(frames)
+                    if on_partial and on_partial(partial):
+                        text = partial
+                        break
+
+            if speech_start is None and timeout and now - start_time > timeout:
+                raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+            if speech_start is not None and phrase_time_limit and now - speech_start > phrase_time_limit:
+                text = json.loads(recognizer.FinalResult()).get("text", "")
+                break
+
+        self.last_audio = sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+        if not text.strip():
+            raise sr.UnknownValueError()
+        return text
+
+    def _is_loud(self, data, source):
+        """True if a chunk is above the recognizer's ambient-noise energy threshold."""
+        if self.recognizer is None:
+            return False
+        return audioop.rms(data, source.SAMPLE_WIDTH) > self.recognizer.energy_threshold
+
+
+class HybridSpeech(SpeechBackend):
+    """
+    Commands are recognized on-device. Utterances that are not a complete command
+    (no wake word, or words outside the grammar) are re-sent to the cloud.
+    """
+    name = "hybrid"
+
+    def __init__(self, local, transcribe):
+        self.local = local # VoskSpeech
+        self.transcribe = transcribe # Cloud function: sr.AudioData -> transcript
+        self.wake_word = None
+
+    def set_grammar(self, phrases, wake_word=None):
+        self.local.set_grammar(phrases)
+        self.wake_word = wake_word
+
+    def recognize(self, source, timeout, phrase_time_limit, on_partial=None):
+        handled = []
+        def local_partial(text):
+            if on_partial and on_partial(text):
+                handled.append(text)
+                return True
+            return False
+
+        try:
+            text = self.local.recognize(source, timeout, phrase_time_limit, local_partial)
+        except sr.UnknownValueError:
+            text = ""
+        if handled:
+            return text # The caller already acted on it
+        words = text.split()
+        if words and self.wake_word and words[0] == self.wake_word and UNKNOWN_WORD not in words:
+            return text # A command the local grammar fully understood
+
+        print("Not a local command, recognizing in the cloud...")
+        try:
+            return self.transcribe(self.local.last_audio)
+        except sr.RequestError:
+            known = " ".join(word for word in words if word != UNKNOWN_WORD)
+            if not known:
+                raise
+            print("Cloud recognition unavailable, using the on-device result.")
+            return known
+
+
+def create_backend(name, recognizer, transcribe, model_path=None):
+    """
+    Builds the backend called name ("cloud", "vosk" or "hybrid").
+    Falls back to the cloud backend if Vosk or its model is not available.
+    """
+    if name in ("vosk", "hybrid"):
+        if not vosk_available:
+            print("Warning: 'vosk' not installed. Using cloud speech recognition.")
+        elif not model_path or not os.path.isdir(model_path):
+            print(f"Warning: Vosk model not found at '{model_path}'. Using cloud speech recognition.")
+        else:
+            try:
+                local = VoskSpeech(model_path, recognizer)
+                return local if name == "vosk" else HybridSpeech(local, transcribe)
+            except Exception as e:
+                print(f"Warning: Could not load Vosk model: {e}. Using cloud speech recognition.")
+    elif name != "cloud":
+        print(f"Warning: Unknown speech backend '{name}'. Using cloud speech recognition.")
+    return CloudSpeech(recognizer, transcribe)
@@ -0,0 +1,178 @@
+# -*- coding:utf-8 -*-
+
+'''!
+  @file Ninja_Teleop.py
+  @brief Teleoperation channel between the web joystick and ninja_core.drive().
+  @n Frames are short JSON objects with a sequence number. Incoming drive frames only
+  @n replace the latest command; a worker applies the newest one at most APPLY_RATE
+  @n times per second, so a burst of frames never queues up behind the servos. If no
+  @n frame arrives for DEADMAN_TIMEOUT while the robot is moving, the wheels are stopped.
+  @n
+  @n Client -> server:
+  @n   {"t": "d", "s": seq, "l": linear, "a": angular, "i": session}  drive (repeat while the stick is held)
+  @n   {"t": "p", "c": client_time}                                   ping
+  @n Server -> client:
+  @n   {"t": "o", "c": client_time, "s": last_seq}  pong (the client computes the RTT)
+  @n   {"t": "e", "m": message, "s": seq}           error (s: the drive frame that failed, if any)
+  @n A new session id (e.g. after a page reload) restarts the sequence numbers.
+  @license The MIT License (MIT)
+'''
+
+import json
+import time
+import threading
+
+# --- Configuration ---
+APPLY_RATE = 50 # Max drive updates per second passed on to the robot
+DEADMAN_TIMEOUT = 0.5 # Seconds without a frame before a moving robot is stopped
+
+# --- Channel ---
+
+class TeleopChannel:
+    """
+    One controller connection. drive(linear, angular) is called from a worker thread
+    and returns False if the robot cannot drive. Failures are passed to on_error(seq,
+    message) from the worker thread; without on_error they are kept for take_error().
+    """
+    def __init__(self, drive, deadman_timeout=DEADMAN_TIMEOUT, on_error=None):
+        self._drive = drive
+        self._deadman_timeout = deadman_timeout
+        self._on_error = on_error
+        self._condition = threading.Condition()
+        self._latest = None # (seq, linear, angular) not applied yet
+        self._last_seq = -1
+        self._session = None # Client session the sequence numbers belong to
+        self._last_frame_time = time.monotonic()
+        self._moving = False # Last applied command was non-zero
+        self._running = False
+        self._thread = None
+        self._error = None # (seq, message) of a failed drive not reported yet
+        # Statistics
+        self.frames = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.deadman_stops = 0
+
+    # --- Worker Control ---
+
+    def start(self):
+        """Starts the worker that applies commands and watches the dead-man timeout."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="teleop", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stops the worker; a robot that is still moving is stopped."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        if self._moving:
+            self._apply(None, 0.0, 0.0)
+
+    # --- Frames ---
+
+    def handle_frame(self, message):
+        """Handles one text frame. Returns the reply frame (str) or None."""
+        try:
+            frame = json.loads(message)
+            kind = frame["t"]
+        except (TypeError, ValueError, KeyError):
+            return json.dumps({"t": "e", "m": "Malformed frame."})
+
+        if kind == "p": # Pings don't reset the dead-man timer: only drive frames keep the robot moving
+            return json.dumps({"t": "o", "c": frame.get("c"), "s": self._last_seq})
+        if kind == "d":
+            try:
+                command = (int(frame["s"]), float(frame.get("l", 0.0)), float(frame.get("a", 0.0)))
+            except (TypeError, ValueError, KeyError):
+                return json.dumps({"t": "e", "m": "Drive frames need s, l and a."})
+            self.submit(*command, session=frame.get("i"))
+            return None # Failures are reported by the worker once the frame has been applied
+        return json.dumps({"t": "e", "m": f"Unknown frame type '{kind}'."})
+
+    def submit(self, seq, linear, angular, session=None):
+        """
+        Replaces the pending command with a newer one; older sequence numbers are dropped.
+        A different session (a reloaded page or new tab) starts counting again.
+        """
+        with self._condition:
+            self.frames += 1
+            self._last_frame_time = time.monotonic()
+            if session != self._session:
+                self._session = session
+                self._last_seq = -1
+            if seq <= self._last_seq:
+                self.stale += 1
+                return
+            self._last_seq = seq
+            if self._latest is not None:
+                self.coalesced += 1
+            self._latest = (seq, linear, angular)
+            self._condition.notify()
+
+    # --- Worker ---
+
+    def _run(self):
+        interval = 1.0 / APPLY_RATE
+        last_apply = 0.0
+        while True:
+            with self._condition:
+                while self._running and self._latest is None:
+                    remaining = self._last_frame_time + self._deadman_timeout - time.monotonic()
+                    if self._moving and remaining <= 0:
+                        break
+                    self._condition.wait(remaining if self._moving else None)
+                if not self._running:
+                    return
+                command = self._latest
+                self._latest = None
+                deadman = command is None
+
+            if deadman:
+                print(f"Teleop: no frame for {self._deadman_timeout:.1f}s, stopping.")
+                self.deadman_stops += 1
+                self._apply(None, 0.0, 0.0)
+                continue
+            wait = last_apply + interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait) # Rate limit; frames arriving meanwhile are coalesced
+                with self._condition:
+                    if self._latest is not None:
+                        command, self._latest = self._latest, None
+                        self.coalesced += 1
+            last_apply = time.monotonic()
+            self._apply(*command)
+
+    def _apply(self, seq, linear, angular):
+        """Passes one command on to drive(); seq is None for the channel's own stops."""
+        if not self._drive(linear, angular):
+            message = "Robot cannot drive (not ready or servos unavailable)."
+            if self._on_error:
+                self._on_error(seq, message)
+            else:
+                with self._condition:
+                    self._error = (seq, message)
+        self.applied += 1
+        self._moving = linear != 0 or angular != 0
+
+    def take_error(self):
+        """Returns (seq, message) of the last failed drive not reported yet, or None."""
+        with self._condition:
+            error, self._error = self._error, None
+            return error
+
+    # --- Status ---
+
+    def stats(self):
+        """Frame counters of this channel."""
+        return {
+            "frames": self.frames,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "deadman_stops": self.deadman_stops,
+        }
@@ -18,8 +18,14 @@ import time
 import re
 import threading
 import json
+import random
+import hashlib
+import collections
+from concurrent import futures
 import RPi.GPIO as GPIO
-import google.generativeai as genai
+# google.generativeai is imported in initialize_gemini(): it is slow to load and
+# importing it lazily lets hardware and audio start up in parallel.
+genai = None
 
 # --- Configuration ---
 
@@ -28,8 +34,49 @@ GOOGLE_API_KEY = "Input your Gemini API key here!"  # <----------- input your AP
 # GEMINI_MODEL_NAME = "gemini-1.0-pro" # Or a model known to be good at following instructions & potential search
 GEMINI_MODEL_NAME = "gemini-2.0-flash-lite" # Use a recent, capable flash model
 
+# Gemini Client Timing (keeps tail latency bounded)
+GEMINI_CALL_TIMEOUT = 8.0 # Deadline for a single API attempt (seconds)
+GEMINI_TOTAL_DEADLINE = 15.0 # Deadline for the whole interpretation incl. retries (seconds)
+GEMINI_MAX_RETRIES = 2 # Extra attempts after the first one fails
+GEMINI_RETRY_BASE_DELAY = 0.5 # Backoff base (seconds), full jitter is applied
+GEMINI_HEDGE_ENABLED = True # Send a duplicate request if the first is slower than usual
+GEMINI_HEDGE_MIN_DELAY = 1.5 # Hedge delay used until enough latencies are recorded (seconds)
+GEMINI_LATENCY_SAMPLES = 50 # Recent latencies kept for the p95 estimate
+GEMINI_BREAKER_FAILURES = 3 # Consecutive failed requests (all retries used up) that open the circuit breaker
+GEMINI_BREAKER_COOLDOWN = 30.0 # Seconds to use the local parser before trying Gemini again
+
+# Gemini Output Limits
+ANSWER_MAX_OUTPUT_TOKENS = 1024
+COMMAND_MAX_OUTPUT_TOKENS = 384 # A schema-constrained plan of MAX_PLAN_STEPS actions fits easily
+
+# Multi-step Plans
+MAX_PLAN_STEPS = 8 # Longest routine accepted from one command
+MAX_STEP_SECONDS = 30.0 # Upper bound for a step's duration/wait
+MAX_MOVE_STEPS = 20 # Upper bound for a bounded movement's step count
+MAX_ROTATION_DEGREES = 720 # Upper bound for a bounded rotation
+# Action keys that bound a movement -> keyword argument of the movement function
+# ("step_count" rather than "steps", which is the plan's list of actions)
+BOUND_KEYS = {"step_count": "steps", "degrees": "degrees", "duration": "duration"}
+
+# Face Display Configuration (only used if the face modules are present)
+FACE_CACHE_FILE = "face_frames.npy"
+FACE_FPS = 30
+# Sound keyword -> face expression shown while/after the sound plays
+SOUND_TO_EXPRESSION = {
+    "hello": "happy", "thanks": "happy", "thank you": "happy", "yes": "happy",
+    "happy": "happy", "exciting": "amazing", "no": "confuse",
+    "danger": "angry", "scared": "scary", "stop": "scary",
+}
+
 # Robot Hardware Configuration
 DISTANCE_THRESHOLD_CM = 5.0 # Stop distance in cm
+DRIVE_OBSTACLE_HOLD = 1.0 # Seconds forward drive() commands are ignored after an obstacle stop
+
+# Hardware Bring-up (subsystems start in parallel)
+BOARD_CONNECT_ATTEMPTS = 5 # I2C expansion board connection attempts before giving up
+BOARD_RETRY_BASE_DELAY = 0.25 # First retry delay, doubled after each failure (seconds)
+BOARD_RETRY_MAX_DELAY = 2.0
+SUBSYSTEM_WAIT_TIMEOUT = 15.0 # Max time a command waits for a subsystem that is still starting
 WAKE_WORD = "ninja" # Used internally to check if it's a command
 
 # --- Import Robot Modules ---
@@ -42,20 +89,57 @@ except ImportError as e:
     print("Ensure Ninja_Movements_v1.py, Ninja_Buzzer.py, Ninja_Distance.py are in the same directory.")
     sys.exit(1)
 
+# Optional face display: copy lcd_driver.py, robot_face.py and face_player.py
+# from SPIDisplayTest into this directory to enable it.
+try:
+    from lcd_driver import WaveshareLCD
+    from robot_face import RobotFace
+    from face_player import FacePlayer
+    face_display_available = True
+except ImportError:
+    face_display_available = False
+
 # --- Global Variables ---
-model = None
+model = None # Question/answer model
+command_model = None # Command interpretation model (system instruction holds the robot API)
+command_prompt_version = None
+command_generation_config = None
+answer_generation_config = None
 movement_thread = None
+continuous_move_name = None # Name of the continuous movement movement_thread is running
 distance_check_thread = None
 is_continuous_moving = False
+last_obstacle_time = 0.0 # time.monotonic() of the last obstacle stop
+drive_lock = threading.Lock() # Serializes starting/stopping movements: drive() (web requests) and _execute_action() (voice/plan threads)
 buzzer_pwm = None
 keep_distance_checking = False
 hardware_initialized = False
+startup_thread = None
+face_lcd = None
+face_player = None
+
+# Gemini client state
+gemini_executor = futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="gemini")
+interpretation_executor = futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="interpret")
+gemini_latencies = collections.deque(maxlen=GEMINI_LATENCY_SAMPLES)
+gemini_state_lock = threading.Lock()
+breaker_failures = 0
+breaker_open_until = 0.0
+
+# Plan execution state
+plan_thread = None
+plan_cancel_event = threading.Event()
+
+# Hardware subsystem readiness: 'off' -> 'starting' -> 'ready' or 'failed'
+SUBSYSTEMS = ('servos', 'buzzer', 'distance', 'face')
+subsystem_state = {name: 'off' for name in SUBSYSTEMS}
+subsystem_done = {name: threading.Event() for name in SUBSYSTEMS} # Set once a subsystem is ready or failed
 
 # --- Initialization Functions ---
 
 def initialize_gemini():
     """Initializes the Gemini model."""
-    global model
+    global genai, model, command_model, command_prompt_version, command_generation_config, answer_generation_config
     if model:
         print("Gemini already initialized.")
         return True
@@ -65,6 +149,8 @@ def initialize_gemini():
         print("Error: GOOGLE_API_KEY is not set in ninja_core.py. Please add your key.")
         return False
     try:
+        import google.generativeai
+        genai = google.generativeai
         print("Configuring Gemini using API Key.")
         genai.configure(api_key=GOOGLE_API_KEY)
         # Configure safety settings to be less restrictive for general conversation
@@ -75,62 +161,217 @@ def initialize_gemini():
             {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
             {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
         ]
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME, safety_settings=safety_settings)
+        # Static instructions are sent once as system instructions instead of with every request
+        command_instruction = build_command_instruction()
+        command_prompt_version = prompt_version(command_instruction)
+        command_model = genai.GenerativeModel(GEMINI_MODEL_NAME, safety_settings=safety_settings,
+                                              system_instruction=command_instruction)
+        # Commands use JSON mode constrained by a schema built from the same registries
+        command_generation_config = genai.types.GenerationConfig(
+            temperature=0.2,
+            max_output_tokens=COMMAND_MAX_OUTPUT_TOKENS,
+            response_mime_type="application/json",
+            response_schema=build_plan_schema()
+        )
+        answer_generation_config = genai.types.GenerationConfig(
+            temperature=0.7, # Higher temp for answers
+            max_output_tokens=ANSWER_MAX_OUTPUT_TOKENS
+        )
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME, safety_settings=safety_settings,
+                                      system_instruction=QUESTION_INSTRUCTION)
         # Optional: Test generation to confirm connection
         # test_response = model.generate_content("Test prompt")
         # print("Gemini test response received.")
-        print("Gemini model loaded successfully.")
+        print(f"Gemini model loaded successfully (command prompt version {command_prompt_version}).")
         return True
     except Exception as e:
         print(f"Error configuring or loading Gemini model: {e}")
         model = None
+        command_model = None
         return False
 
-def initialize_hardware():
-    """Initializes Servos, Buzzer, Distance Sensor and performs startup sequence."""
-    global buzzer_pwm, hardware_initialized
+def initialize_hardware(async_startup=False):
+    """
+    Starts Servos, Buzzer, Distance Sensor and Face in parallel and performs the startup sequence.
+    Each subsystem reports its own readiness (see subsystem_ready()), so a failing
+    or slow part only blocks the commands that need it.
+    With async_startup=True this returns as soon as the bring-up has been started (use
+    hardware_ready() for the outcome); otherwise it waits for every subsystem and returns
+    False if the servos failed. Without servos the hardware is released again.
+    """
+    global hardware_initialized, startup_thread
     if hardware_initialized:
         print("Hardware already initialized.")
         return True
 
     print("Initializing hardware components...")
+    init_functions = {
+        'servos': _init_servos,
+        'buzzer': _init_buzzer,
+        'distance': _init_distance,
+        'face': _init_face,
+    }
+    for name in SUBSYSTEMS:
+        subsystem_state[name] = 'starting'
+        subsystem_done[name].clear()
+    hardware_initialized = True # GPIO now belongs to us; per-subsystem state says what is usable
+    for name in SUBSYSTEMS:
+        threading.Thread(target=_bring_up, args=(name, init_functions[name]), name=f"init-{name}", daemon=True).start()
+
+    if async_startup:
+        startup_thread = threading.Thread(target=_startup_sequence, daemon=True)
+        startup_thread.start()
+        return True
+
+    if not hardware_ready():
+        return False
+    for name in SUBSYSTEMS:
+        subsystem_done[name].wait()
+    print("Hardware components initialized.")
+    _startup_sequence()
+    return True
+
+
+def hardware_ready(timeout=None):
+    """
+    Waits (up to timeout seconds, None = until it is done) for the servo bring-up started by
+    initialize_hardware() and returns True if the servos are usable. If they failed, the
+    other subsystems are released again (GPIO cleanup) and hardware_initialized is reset.
+    """
+    if not hardware_initialized:
+        return False
+    if subsystem_ready('servos', timeout):
+        return True
+    if subsystem_state['servos'] == 'failed':
+        print("Error: Servo controller failed to start. Releasing hardware.")
+        for name in SUBSYSTEMS: # Let the other subsystems finish before their GPIO is released
+            subsystem_done[name].wait(SUBSYSTEM_WAIT_TIMEOUT)
+        wait_for_startup_sequence()
+        _release_hardware()
+    return False
+
+
+def _bring_up(name, init_function):
+    """Runs one subsystem's init in its own thread and records the outcome."""
+    start_time = time.monotonic()
     try:
-        movements.init_board_and_servo()
-        buzzer.setup()
-        buzzer_pwm = GPIO.PWM(buzzer.BUZZER_PIN, 440)
-        buzzer_pwm.start(0)
-        distance.setup_sensor()
+        init_function()
+        subsystem_state[name] = 'ready'
+        print(f"Subsystem '{name}' ready ({time.monotonic() - start_time:.2f}s).")
+    except Exception as e:
+        subsystem_state[name] = 'failed'
+        print(f"Subsystem '{name}' failed to start: {e}")
+    finally:
+        subsystem_done[name].set()
+
 
-        hardware_initialized = True # Set flag AFTER successful component init
-        print("Hardware components initialized.")
+def _init_servos():
+    if not movements.init_board_and_servo(attempts=BOARD_CONNECT_ATTEMPTS,
+                                          base_delay=BOARD_RETRY_BASE_DELAY,
+                                          max_delay=BOARD_RETRY_MAX_DELAY):
+        raise RuntimeError("I2C expansion board not detected")
 
-        # --- Startup Sequence (Requirement 5) ---
-        print("Performing startup sequence...")
+
+def _init_buzzer():
+    global buzzer_pwm
+    buzzer.setup()
+    buzzer_pwm = GPIO.PWM(buzzer.BUZZER_PIN, 440)
+    buzzer_pwm.start(0)
+
+
+def _init_distance():
+    distance.setup_sensor() # Returns at once; the sensor settles before its first reading
+    if not distance.gpio_initialized:
+        raise RuntimeError("distance sensor GPIO setup failed")
+
+
+def _init_face():
+    initialize_face()
+    if not face_player:
+        raise RuntimeError("face display not available")
+
+
+def subsystem_ready(name, timeout=SUBSYSTEM_WAIT_TIMEOUT):
+    """
+    Returns True if the subsystem is ready. If it is still starting, waits up to
+    timeout seconds for it first (timeout=0 only checks).
+    """
+    if subsystem_state[name] == 'starting':
+        subsystem_done[name].wait(timeout)
+    return subsystem_state[name] == 'ready'
+
+
+def get_subsystem_status():
+    """Returns a copy of the per-subsystem readiness, e.g. {'servos': 'ready', ...}."""
+    return dict(subsystem_state)
+
+
+def get_hardware_stats():
+    """Returns subsystem readiness, I2C bus statistics, servo power/load estimates and ADC/battery readings (for the web status page)."""
+    return {
+        "subsystems": get_subsystem_status(),
+        "i2c_bus": movements.bus_stats(),
+        "servos": movements.servo_stats(),
+        "adc": movements.adc_stats(),
+    }
+
+
+def _startup_sequence():
+    """Startup sound and hello movement (Requirement 5), each as soon as its subsystem is up."""
+    print("Performing startup sequence...")
+    if subsystem_ready('buzzer'):
         play_robot_sound('hello') # Play sound first
+    if subsystem_ready('servos'):
         time.sleep(0.2) # Small delay
-        movements.hello() # Perform hello movement
+        movements.hello() # Perform hello movement (ends standing, servos settled)
         # movements.reset_servos() # Ensure it returns to stand after hello
-        print("Startup sequence complete.")
-        # --- End Startup Sequence ---
+    print("Startup sequence complete.")
 
-        time.sleep(0.5) # Allow servos to settle fully
 
-        return True
+def wait_for_startup_sequence():
+    """Blocks until a background startup gesture has finished (it owns the servos)."""
+    global startup_thread
+    if startup_thread and startup_thread.is_alive() and startup_thread is not threading.current_thread():
+        print("Waiting for startup sequence to finish...")
+        startup_thread.join()
+    startup_thread = None
 
+
+def initialize_face():
+    """Starts the optional face display. The robot works without it."""
+    global face_lcd, face_player
+    if not face_display_available:
+        print("Face display modules not found. Running without a face.")
+        return
+    if face_player:
+        return
+    try:
+        face_lcd = WaveshareLCD()
+        face_player = FacePlayer(RobotFace(face_lcd, cache_file=FACE_CACHE_FILE), fps=FACE_FPS)
+        face_player.start()
+        face_player.set_expression('idle')
     except Exception as e:
-        print(f"An error occurred during hardware initialization: {e}")
-        try: GPIO.cleanup()
-        except Exception: pass
-        hardware_initialized = False
-        return False
+        print(f"Face display unavailable: {e}")
+        face_lcd = None
+        face_player = None
+
+
+def set_face_expression(expression):
+    """Changes the face expression without blocking (no-op without a face display)."""
+    if face_player and expression:
+        face_player.set_expression(expression)
+
 
 # --- Cleanup Function ---
 
 def cleanup_all():
     """Stops all actions, performs shutdown sequence, and cleans up resources."""
-    global keep_distance_checking, movement_thread, distance_check_thread, is_continuous_moving, hardware_initialized, buzzer_pwm
-
     print("\n--- Initiating Cleanup ---")
+    cancel_plan()
+    for name in SUBSYSTEMS: # Don't tear down while a subsystem is still starting
+        if subsystem_state[name] == 'starting':
+            subsystem_done[name].wait(SUBSYSTEM_WAIT_TIMEOUT)
+    wait_for_startup_sequence()
 
     # --- Shutdown Sequence (Requirement 6) ---
     if hardware_initialized:
@@ -138,14 +379,12 @@ def cleanup_all():
         try:
             # Stop any active movement first
             if is_continuous_moving:
-                movements.stop() # This should also set stop_movement = True
-                time.sleep(0.2) # Give threads time to see flag
+                movements.stop(settle_pose='rest') # Sets stop_movement and lowers straight to rest
 
             play_robot_sound('thanks') # Play sound
             time.sleep(0.5) # Let sound play
-            if movements.servo:
-                movements.rest() # Move to rest position
-                time.sleep(1.0) # Wait for rest movement
+            if subsystem_state['servos'] == 'ready' and movements.servo:
+                movements.rest() # Move to rest position (returns once the servos have arrived)
             else:
                  print("Warning: Servo object not available, cannot move to rest.")
 
@@ -155,6 +394,12 @@ def cleanup_all():
     else:
         print("Skipping shutdown sequence as hardware was not initialized.")
     # --- End Shutdown Sequence ---
+    _release_hardware()
+
+
+def _release_hardware():
+    """Stops the worker threads and the I2C bus, turns off buzzer and face and cleans up GPIO."""
+    global keep_distance_checking, movement_thread, distance_check_thread, is_continuous_moving, hardware_initialized, buzzer_pwm, face_player, face_lcd
 
     # 1. Stop Distance Checking Thread
     print("Stopping distance checker...")
@@ -170,7 +415,15 @@ def cleanup_all():
         movement_thread.join(timeout=1.0) # Wait again just in case
     movement_thread = None
     is_continuous_moving = False
+    movements.shutdown_bus() # Sends the queued rest pose, then stops the I2C worker
+
 
+    if face_player:
+        print("Stopping face display...")
+        face_player.set_expression('sleepy')
+        time.sleep(0.3)
+        face_player.stop()
+        face_player = None
 
     if hardware_initialized:
         # 3. Stop Buzzer
@@ -180,6 +433,11 @@ def cleanup_all():
             except Exception: pass
         else: print("Buzzer PWM object not found or not initialized.")
 
+        if face_lcd:
+            try: face_lcd.cleanup()
+            except Exception: pass
+            face_lcd = None
+
         # 4. Cleanup GPIO
         print("Cleaning up GPIO...")
         try: GPIO.cleanup()
@@ -191,6 +449,221 @@ def cleanup_all():
     # Reset flags
     hardware_initialized = False
     buzzer_pwm = None
+    for name in SUBSYSTEMS:
+        subsystem_state[name] = 'off'
+
+# --- Prompt Templates ---
+
+QUESTION_INSTRUCTION = (
+    "You are a helpful assistant integrated into a small robot. Answer the user's question "
+    "concisely based on your knowledge. You can access and process information from the "
+    "real-time internet. Provide a brief, conversational answer."
+)
+
+COMMAND_EXAMPLES = [
+    ("can you walk", {"action_type": "combo", "move_function": "walk", "speed": "normal", "sound_keyword": "yes"}),
+    ("run for your life", {"action_type": "combo", "move_function": "run", "speed": "fast", "sound_keyword": "danger"}),
+    ("make a happy sound", {"action_type": "sound", "sound_keyword": "happy"}),
+    ("stop everything", {"action_type": "move", "move_function": "stop"}),
+    ("turn left slowly", {"action_type": "combo", "move_function": "turnleft_step", "speed": "slow", "sound_keyword": "left"}),
+    ("turn around", {"action_type": "combo", "move_function": "rotateleft", "speed": "normal", "sound_keyword": "left", "degrees": 180}),
+    ("take three steps forward", {"action_type": "move", "move_function": "walk", "speed": "normal", "step_count": 3}),
+    ("servo 0 to 45", {"action_type": "servo", "servo_id": 0, "servo_angle": 45}),
+    ("go stand over there", {"action_type": "unknown", "error": "Cannot navigate to locations."}),
+]
+
+# Compound commands become several steps in one reply
+PLAN_EXAMPLES = [
+    ("say hello then walk slowly and stop after a bit", [
+        {"action_type": "sound", "sound_keyword": "hello"},
+        {"action_type": "move", "move_function": "walk", "speed": "slow", "duration": 3},
+    ]),
+    ("spin right for two seconds, wait, then wave", [
+        {"action_type": "combo", "move_function": "rotateright", "speed": "normal", "sound_keyword": "right", "duration": 2, "wait": 1},
+        {"action_type": "move", "move_function": "hello"},
+    ]),
+]
+
+
+def build_command_instruction():
+    """
+    Builds the command system instruction from the movement and sound registries,
+    so the prompt always lists exactly the functions that exist.
+    """
+    speeds = ", ".join(f"'{s}'" for s in movements.SPEEDS)
+    move_lines = []
+    for name, (kind, description) in movements.MOVEMENTS.items():
+        marker = "*" if kind in ('continuous', 'step') else ""
+        move_lines.append(f"- '{name}'{marker}: {description}")
+    move_lines.append("- 'set_servo_angle': Set a servo (0-3) to an angle (0-180). Use action_type 'servo'.")
+    sound_keywords = ", ".join(f"'{k}'" for k in buzzer.SOUND_MAP)
+    example_lines = [f'"{command}" -> {json.dumps({"steps": [action]})}' for command, action in COMMAND_EXAMPLES]
+    example_lines += [f'"{command}" -> {json.dumps({"steps": steps})}' for command, steps in PLAN_EXAMPLES]
+
+    return "\n".join([
+        "You translate commands for a small robot into a JSON plan of actions.",
+        "Movement functions (* = accepts speed):",
+        *move_lines,
+        f"Sound keywords: {sound_keywords}",
+        f"Reply with {{\"steps\": [...]}}: the actions in order (at most {MAX_PLAN_STEPS}). Each action has keys:",
+        "- action_type: 'move', 'sound', 'combo' (move and sound), 'servo' or 'unknown'",
+        "- move_function: required for 'move'/'combo'",
+        f"- speed: optional, one of {speeds}",
+        "- sound_keyword: required for 'sound'/'combo'; infer one if not explicit ('yes' to confirm, 'danger' if urgent, 'no' if unknown)",
+        "- servo_id, servo_angle: required for 'servo'",
+        "- error: reason, when action_type is 'unknown'",
+        "- duration: optional seconds a continuous move runs before stopping",
+        f"- step_count: optional number of steps (1-{MAX_MOVE_STEPS}) for {_quoted(movements.BOUNDED_MOVEMENTS['steps'])}",
+        f"- degrees: optional angle to turn (1-{MAX_ROTATION_DEGREES}) for {_quoted(movements.BOUNDED_MOVEMENTS['degrees'])}; 180 turns around",
+        "- wait: optional seconds to pause after the step",
+        "Bounded moves (duration, step_count, degrees) end by themselves; prefer them over a separate 'stop'.",
+        "Examples:",
+        *example_lines,
+    ])
+
+
+def _quoted(names):
+    return ", ".join(f"'{name}'" for name in names)
+
+
+def prompt_version(instruction):
+    """Short hash identifying a prompt, logged so behaviour changes can be traced to prompt changes."""
+    return hashlib.sha256(instruction.encode('utf-8')).hexdigest()[:12]
+
+
+ACTION_TYPES = ("move", "sound", "combo", "servo", "unknown")
+SERVO_ID_RANGE = (0, 3)
+SERVO_ANGLE_RANGE = (0, 180)
+
+
+def build_action_schema():
+    """Schema for one action, derived from the movement and sound registries."""
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "action_type": {"type": "STRING", "enum": list(ACTION_TYPES)},
+            "move_function": {"type": "STRING", "enum": list(movements.MOVEMENTS)},
+            "speed": {"type": "STRING", "enum": list(movements.SPEEDS)},
+            "sound_keyword": {"type": "STRING", "enum": list(buzzer.SOUND_MAP)},
+            "servo_id": {"type": "INTEGER"},
+            "servo_angle": {"type": "INTEGER"},
+            "error": {"type": "STRING"},
+            "duration": {"type": "NUMBER"},
+            "wait": {"type": "NUMBER"},
+            "step_count": {"type": "INTEGER"},
+            "degrees": {"type": "NUMBER"},
+        },
+        "required": ["action_type"],
+    }
+
+
+def build_plan_schema():
+    """Response schema for Gemini's JSON mode: an ordered list of actions."""
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "steps": {"type": "ARRAY", "items": build_action_schema()},
+        },
+        "required": ["steps"],
+    }
+
+
+def validate_action(action_data):
+    """
+    Checks an action dictionary against the registries without any API call.
+    Returns None if it is valid, otherwise a short error description.
+    """
+    if not isinstance(action_data, dict):
+        return "Action is not an object."
+    action_type = action_data.get("action_type")
+    if action_type not in ACTION_TYPES:
+        return f"Unknown action_type '{action_type}'."
+
+    move_function = action_data.get("move_function")
+    if action_type in ("move", "combo"):
+        if move_function not in movements.MOVEMENTS:
+            return f"Unknown move_function '{move_function}'."
+    speed = action_data.get("speed")
+    if speed is not None and speed not in movements.SPEEDS:
+        return f"Unknown speed '{speed}'."
+
+    sound_keyword = action_data.get("sound_keyword")
+    if action_type == "sound" and not sound_keyword:
+        return "Missing sound_keyword."
+    if sound_keyword is not None and str(sound_keyword).lower() not in buzzer.SOUND_MAP:
+        return f"Unknown sound_keyword '{sound_keyword}'."
+
+    if action_type == "servo":
+        servo_id = action_data.get("servo_id")
+        servo_angle = action_data.get("servo_angle")
+        if not isinstance(servo_id, int) or not isinstance(servo_angle, int):
+            return "servo_id and servo_angle must be integers."
+        if not SERVO_ID_RANGE[0] <= servo_id <= SERVO_ID_RANGE[1]:
+            return f"servo_id {servo_id} out of range."
+        if not SERVO_ANGLE_RANGE[0] <= servo_angle <= SERVO_ANGLE_RANGE[1]:
+            return f"servo_angle {servo_angle} out of range."
+
+    for timing_key in ("duration", "wait"):
+        value = action_data.get(timing_key)
+        if value is None:
+            continue
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return f"{timing_key} must be a number."
+        if not 0 <= value <= MAX_STEP_SECONDS:
+            return f"{timing_key} {value} out of range."
+
+    # duration is checked above (and ignored for finite moves); step_count and degrees must fit the move
+    for bound_key, limit in (("step_count", MAX_MOVE_STEPS), ("degrees", MAX_ROTATION_DEGREES)):
+        value = action_data.get(bound_key)
+        if value is None:
+            continue
+        if bound_key == "step_count" and (not isinstance(value, int) or isinstance(value, bool)):
+            return "step_count must be an integer."
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return f"{bound_key} must be a number."
+        if action_type not in ("move", "combo") or move_function not in movements.BOUNDED_MOVEMENTS[BOUND_KEYS[bound_key]]:
+            return f"{bound_key} does not apply to '{move_function}'."
+        if not 1 <= value <= limit:
+            return f"{bound_key} {value} out of range (1-{limit})."
+    return None
+
+
+def movement_bounds(action_data):
+    """Keyword arguments (steps, degrees, duration) that bound the action's movement, or {}."""
+    move_function = action_data.get("move_function")
+    bounds = {}
+    for bound_key, keyword in BOUND_KEYS.items():
+        value = action_data.get(bound_key)
+        if value and move_function in movements.BOUNDED_MOVEMENTS[keyword]:
+            bounds[keyword] = value
+    return bounds
+
+
+def interpretation_result(steps):
+    """
+    Result structure for interpreted steps: {"type": "action"} for one untimed step,
+    {"type": "plan"} otherwise, so a step's duration and wait are kept for execute_plan.
+    """
+    if len(steps) == 1 and steps[0].get("duration") is None and steps[0].get("wait") is None:
+        return {"type": "action", "data": steps[0]}
+    return {"type": "plan", "steps": steps}
+
+
+def validate_plan(plan_data):
+    """Validates a {"steps": [...]} plan. Returns None if valid, otherwise an error description."""
+    if not isinstance(plan_data, dict) or not isinstance(plan_data.get("steps"), list):
+        return "Plan has no steps list."
+    steps = plan_data["steps"]
+    if not steps:
+        return "Plan is empty."
+    if len(steps) > MAX_PLAN_STEPS:
+        return f"Plan has {len(steps)} steps (max {MAX_PLAN_STEPS})."
+    for i, step in enumerate(steps):
+        step_error = validate_action(step)
+        if step_error:
+            return f"Step {i + 1}: {step_error}"
+    return None
+
 
 # --- Gemini Interaction (Modified) ---
 
@@ -199,131 +672,309 @@ def get_gemini_interpretation(user_input, is_command):
     Sends the input to Gemini, choosing a prompt based on whether it's a command or question.
     Returns a dictionary:
         {"type": "answer", "text": "..."} for questions
-        {"type": "action", "data": {...}} for commands (using the previous JSON format)
+        {"type": "action", "data": {...}} for single-step commands (using the previous JSON format)
+        {"type": "plan", "steps": [{...}, ...]} for compound commands (run with execute_plan)
         {"type": "error", "text": "..."} on failure
     """
     global model
     if not model:
         print("Error: Gemini model not initialized.")
-        return {"type": "error", "text": "Gemini model not ready."}
+        return _local_fallback(user_input, is_command, "Gemini model not ready.")
+    if _breaker_is_open():
+        print("Gemini circuit breaker is open. Using local intent parser.")
+        return _local_fallback(user_input, is_command, "My AI connection is down. Please try a simple command.")
 
     if is_command:
-        # --- COMMAND PROMPT ---
-        prompt = f"""
-Analyze the following robot command and determine the intended action(s).
-The robot has functions for movement and making sounds.
-
-Available Movement Functions:
-- 'hello': A specific wave/wiggle sequence.
-- 'walk': Continuous forward walking. Speed options: 'normal', 'fast', 'slow'.
-- 'stepback': Continuous backward walking. Speed options: 'normal', 'fast', 'slow'.
-- 'run': Continuous forward running (tire mode). Speed options: 'normal', 'fast', 'slow'.
-- 'runback': Continuous backward running (tire mode). Speed options: 'normal', 'fast', 'slow'.
-- 'turnleft_step': Perform ONE step turning left.
-- 'turnright_step': Perform ONE step turning right.
-- 'rotateleft': Continuous counter-clockwise rotation (tire mode). Speed options: 'normal', 'fast', 'slow'.
-- 'rotateright': Continuous clockwise rotation (tire mode). Speed options: 'normal', 'fast', 'slow'.
-- 'stop': Stop any ongoing continuous movement.
-- 'reset_servos': Return to standard standing position.
-- 'rest': Go to lowered resting position.
-- 'set_servo_angle': Set a specific servo (0-3) to an angle (0-180). (Parse ID and Angle if possible)
-
-Available Sound Keywords (map to these keywords for the 'sound_keyword' field):
-- 'hello', 'thanks', 'thank you', 'no', 'yes', 'danger', 'exciting', 'happy', 'right', 'left', 'scared', 'stop'
-
-Output Format:
-Return ONLY a valid JSON object describing the action. Do NOT include ```json ... ``` markers or any other text. Use the following keys:
-- "action_type": "move", "sound", "combo" (move and sound), "servo", or "unknown".
-- "move_function": (string) Name of the movement function (e.g., "walk", "hello"). Required if action_type is "move" or "combo".
-- "speed": (string) "fast", "slow", or "normal". Optional.
-- "sound_keyword": (string) The keyword for the sound (e.g., "hello", "danger"). Required if action_type is "sound" or "combo". Gemini should infer appropriate sounds (like 'yes' for confirmation, 'danger' for urgent commands, 'no' for unknown) if not explicit.
-- "servo_id": (int) Servo ID (0-3). Required if action_type is "servo".
-- "servo_angle": (int) Servo angle (0-180). Required if action_type is "servo".
-- "error": (string) Description if the command is unclear or cannot be mapped. Set action_type to "unknown".
-
-Examples:
-Command: "can you walk" -> {{"action_type": "combo", "move_function": "walk", "speed": "normal", "sound_keyword": "yes"}}
-Command: "run for your life" -> {{"action_type": "combo", "move_function": "run", "speed": "fast", "sound_keyword": "danger"}}
-Command: "make a happy sound" -> {{"action_type": "sound", "sound_keyword": "happy"}}
-Command: "stop everything" -> {{"action_type": "move", "move_function": "stop"}}
-Command: "turn left slowly" -> {{"action_type": "combo", "move_function": "turnleft_step", "speed": "slow", "sound_keyword": "left"}}
-Command: "servo 0 to 45" -> {{"action_type": "servo", "servo_id": 0, "servo_angle": 45}}
-Command: "go stand over there" -> {{"action_type": "unknown", "error": "Cannot navigate to locations."}}
-
-Robot Command: "{user_input}"
-
-Analyze the command and provide ONLY the JSON output:
-"""
+        # Instructions live in command_model's system instruction; only the command is sent
+        gemini_model = command_model
+        generation_config = command_generation_config
+        prompt = f'Robot Command: "{user_input}"'
         expected_type = "action"
-
     else:
-        # --- QUESTION PROMPT ---
-        prompt = f"""
-You are a helpful assistant integrated into a small robot. Answer the user's question concisely based on your knowledge. You can access and process information from the real-time internet.
+        gemini_model = model
+        generation_config = answer_generation_config
+        prompt = user_input
+        expected_type = "answer"
 
-User Question: "{user_input}"
+    print(f"Sending to Gemini ({expected_type} mode, prompt {command_prompt_version}): '{user_input}'")
+    try:
+        response_text = generate_gemini_text(gemini_model, prompt, generation_config)
+    except GeminiBlockedError:
+        return {"type": "error", "text": "My safety filters blocked the response. Please ask differently."}
+    except Exception as e:
+        print(f"Error communicating with Gemini API: {e}")
+        return _local_fallback(user_input, is_command, f"API communication error: {e}")
 
-Provide a brief, conversational answer:
-"""
-        expected_type = "answer"
+    if expected_type == "answer":
+        print(f"Gemini Answer: {response_text}")
+        return {"type": "answer", "text": response_text}
 
-    print(f"Sending to Gemini ({expected_type} mode): '{user_input}'")
+    # Expected type is "action": JSON mode guarantees the shape, the validator checks the values
+    try:
+        plan_data = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        print(f"Error: Gemini returned invalid JSON: {e}")
+        print(f"Received: {response_text}")
+        return _local_fallback(user_input, is_command, "Invalid JSON action response from AI.")
+
+    validation_error = validate_plan(plan_data)
+    if validation_error:
+        print(f"Error: Rejected Gemini plan {plan_data}: {validation_error}")
+        return _local_fallback(user_input, is_command, f"Invalid AI action: {validation_error}")
+
+    steps = plan_data["steps"]
+    print(f"Gemini Action JSON: {steps}")
+    return interpretation_result(steps)
+
+
+def submit_gemini_interpretation(user_input, is_command):
+    """
+    Asynchronous version of get_gemini_interpretation.
+    Returns a concurrent.futures.Future resolving to the same result dictionary,
+    so callers (voice loop, Flask workers) can keep working while Gemini thinks.
+    """
+    return interpretation_executor.submit(get_gemini_interpretation, user_input, is_command)
+
+
+# --- Gemini Client (deadlines, retries, hedging, circuit breaker) ---
+
+class GeminiBlockedError(Exception):
+    """Raised when Gemini's safety filters block a response (not worth retrying)."""
+
+
+def _call_gemini(gemini_model, prompt, generation_config):
+    """Runs one generate_content call in a worker thread. Returns (text, latency)."""
+    start_time = time.monotonic()
+    response = gemini_model.generate_content(
+        prompt,
+        generation_config=generation_config,
+        request_options={"timeout": GEMINI_CALL_TIMEOUT}
+    )
     try:
-        generation_config = genai.types.GenerationConfig(
-            temperature=0.7 if expected_type == "answer" else 0.2, # Higher temp for answers
-            max_output_tokens=1024
-        )
-        response = model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
         response_text = response.text.strip()
+    except ValueError as e: # .text raises ValueError when the response was blocked
+        raise GeminiBlockedError(str(e))
+    return response_text, time.monotonic() - start_time
 
-        if expected_type == "answer":
-            print(f"Gemini Answer: {response_text}")
-            return {"type": "answer", "text": response_text}
-        else: # Expected type is "action" (JSON)
-            try:
-                # Try direct parsing first
-                action_data = json.loads(response_text)
-                print(f"Gemini Action JSON: {action_data}")
-                return {"type": "action", "data": action_data}
-            except json.JSONDecodeError:
-                # If direct parse fails, try extracting from markdown
-                print("Direct JSON parsing failed. Trying markdown extraction...")
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL | re.IGNORECASE)
-                if json_match:
-                    json_str = json_match.group(1)
-                    try:
-                        action_data = json.loads(json_str)
-                        print(f"Gemini Action JSON (extracted): {action_data}")
-                        return {"type": "action", "data": action_data}
-                    except json.JSONDecodeError as e_inner:
-                        print(f"Error: Extracted text was not valid JSON: {e_inner}")
-                        print(f"Extracted: {json_str}")
-                        return {"type": "error", "text": "Invalid JSON action response from AI."}
-                else:
-                    print("Error: Could not find or parse JSON object in Gemini response.")
-                    print(f"Received: {response_text}")
-                    return {"type": "error", "text": "Could not parse AI action response."}
 
-    except Exception as e:
-        print(f"Error communicating with Gemini API: {e}")
-        # Check for specific safety blocks which might happen with open questions
-        if "response was blocked" in str(e).lower():
-             return {"type": "error", "text": "My safety filters blocked the response. Please ask differently."}
-        return {"type": "error", "text": f"API communication error: {e}"}
+def _hedge_delay():
+    """Returns the p95 of recent Gemini latencies, used as the hedging delay."""
+    with gemini_state_lock:
+        samples = sorted(gemini_latencies)
+    if len(samples) < 10:
+        return GEMINI_HEDGE_MIN_DELAY
+    return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def _breaker_is_open():
+    """True while the circuit breaker is open and Gemini should not be called."""
+    with gemini_state_lock:
+        return time.monotonic() < breaker_open_until
+
+
+def _record_gemini_success(latency):
+    global breaker_failures
+    with gemini_state_lock:
+        gemini_latencies.append(latency)
+        breaker_failures = 0
+
+
+def _record_gemini_failure():
+    global breaker_failures, breaker_open_until
+    with gemini_state_lock:
+        breaker_failures += 1
+        if breaker_failures >= GEMINI_BREAKER_FAILURES:
+            breaker_open_until = time.monotonic() + GEMINI_BREAKER_COOLDOWN
+            breaker_failures = 0
+            print(f"Gemini circuit breaker OPEN for {GEMINI_BREAKER_COOLDOWN:.0f}s. Using local intent parser.")
+
+
+def _generate_hedged(gemini_model, prompt, generation_config, deadline):
+    """
+    Sends one request and, if it is slower than the recent p95, a duplicate.
+    Returns the text of whichever finishes first.
+    """
+    primary = gemini_executor.submit(_call_gemini, gemini_model, prompt, generation_config)
+    pending = {primary}
+    hedge_sent = not GEMINI_HEDGE_ENABLED
+    last_error = None
+
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        wait_time = remaining if hedge_sent else min(remaining, _hedge_delay())
+        done, pending = futures.wait(pending, timeout=wait_time, return_when=futures.FIRST_COMPLETED)
+        for future in done:
+            try:
+                response_text, latency = future.result()
+                _record_gemini_success(latency)
+                return response_text
+            except GeminiBlockedError:
+                raise
+            except Exception as e:
+                last_error = e
+        if not hedge_sent and not done:
+            print("Gemini is slow, sending hedged request...")
+            pending.add(gemini_executor.submit(_call_gemini, gemini_model, prompt, generation_config))
+            hedge_sent = True
+
+    if last_error and not pending:
+        raise last_error
+    raise TimeoutError("Gemini did not respond before the deadline.")
+
+
+def generate_gemini_text(gemini_model, prompt, generation_config):
+    """
+    Calls Gemini with a per-attempt deadline, jittered retries and hedging.
+    Raises an exception if the circuit breaker is open or all attempts fail.
+    """
+    if not gemini_model:
+        raise RuntimeError("Gemini model not ready.")
+    if _breaker_is_open():
+        raise RuntimeError("Gemini circuit breaker is open.")
+
+    overall_deadline = time.monotonic() + GEMINI_TOTAL_DEADLINE
+    last_error = None
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        attempt_deadline = min(overall_deadline, time.monotonic() + GEMINI_CALL_TIMEOUT)
+        try:
+            return _generate_hedged(gemini_model, prompt, generation_config, attempt_deadline)
+        except GeminiBlockedError:
+            raise
+        except Exception as e:
+            last_error = e
+            print(f"Gemini attempt {attempt + 1} failed: {e}")
+        if _breaker_is_open(): # Opened by another request meanwhile
+            break
+        # Full jitter backoff, but never past the overall deadline
+        backoff = random.uniform(0, GEMINI_RETRY_BASE_DELAY * (2 ** attempt))
+        if time.monotonic() + backoff >= overall_deadline:
+            break
+        time.sleep(backoff)
+    _record_gemini_failure() # One failure per request, not per attempt
+    raise last_error or TimeoutError("Gemini did not respond before the deadline.")
+
+
+# --- Local Intent Parser (used when Gemini is unavailable) ---
+
+# (phrases, move_function, sound_keyword) checked in order, first match wins
+LOCAL_MOVE_INTENTS = [
+    (("stop", "halt", "freeze"), "stop", None),
+    (("turn around", "about face", "full circle", "spin around"), "rotateleft", "left"),
+    (("step back", "stepback", "walk back", "backward", "backwards"), "stepback", "scared"),
+    (("run back", "runback", "reverse"), "runback", "scared"),
+    (("rotate left", "spin left"), "rotateleft", "left"),
+    (("rotate right", "spin right"), "rotateright", "right"),
+    (("turn left",), "turnleft_step", "left"),
+    (("turn right",), "turnright_step", "right"),
+    (("run", "drive"), "run", "exciting"),
+    (("walk", "forward"), "walk", "yes"),
+    (("hello", "hi", "wave"), "hello", "hello"),
+    (("rest", "sit", "sleep"), "rest", "thanks"),
+    (("stand", "reset"), "reset_servos", "yes"),
+]
+FAST_WORDS = ("fast", "quick", "quickly", "hurry")
+SLOW_WORDS = ("slow", "slowly", "gently")
+PHRASE_DEGREES = {"turn around": 180, "about face": 180, "full circle": 360, "spin around": 360}
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "fifteen": 15, "twenty": 20, "thirty": 30, "forty five": 45, "sixty": 60, "ninety": 90,
+    "one hundred eighty": 180, "three hundred sixty": 360,
+}
+STEP_WORDS = ("steps", "step")
+DEGREE_WORDS = ("degrees",)
+_NUMBER_PATTERN = "|".join([r"\d+"] + sorted(NUMBER_WORDS, key=len, reverse=True))
+
+
+def _contains_phrase(text, phrase):
+    return re.search(r'\b' + re.escape(phrase) + r'\b', text) is not None
+
+
+def _parse_count(text, unit_words):
+    """Number in front of one of unit_words ("3 steps", "ninety degrees"), or None."""
+    units = "|".join(re.escape(word) for word in unit_words)
+    match = re.search(rf'\b({_NUMBER_PATTERN})\s+(?:{units})\b', text)
+    if not match:
+        return None
+    number = match.group(1)
+    return int(number) if number.isdigit() else NUMBER_WORDS[number]
+
+
+def parse_local_intent(command_text):
+    """
+    Maps a command to an action dictionary using simple keyword rules.
+    Returns None if nothing matches.
+    """
+    text = command_text.lower()
+
+    servo_match = re.search(r'servo\s*(\d)\D+(\d{1,3})', text)
+    if servo_match:
+        return {"action_type": "servo", "servo_id": int(servo_match.group(1)), "servo_angle": int(servo_match.group(2))}
+
+    speed = "normal"
+    if any(_contains_phrase(text, w) for w in FAST_WORDS):
+        speed = "fast"
+    elif any(_contains_phrase(text, w) for w in SLOW_WORDS):
+        speed = "slow"
+
+    for phrases, move_function, sound_keyword in LOCAL_MOVE_INTENTS:
+        if any(_contains_phrase(text, phrase) for phrase in phrases):
+            if move_function == "stop":
+                return {"action_type": "move", "move_function": "stop"}
+            action = {"action_type": "combo", "move_function": move_function, "speed": speed, "sound_keyword": sound_keyword}
+            # Bounded moves: "walk three steps", "rotate left 90 degrees", "turn around"
+            steps = _parse_count(text, STEP_WORDS)
+            degrees = _parse_count(text, DEGREE_WORDS) or next((d for p, d in PHRASE_DEGREES.items() if _contains_phrase(text, p)), None)
+            if steps and move_function in movements.BOUNDED_MOVEMENTS['steps']:
+                action["step_count"] = min(steps, MAX_MOVE_STEPS)
+            if degrees and move_function in movements.BOUNDED_MOVEMENTS['degrees']:
+                action["degrees"] = min(degrees, MAX_ROTATION_DEGREES)
+            return action
+
+    for sound_keyword in buzzer.SOUND_MAP:
+        if _contains_phrase(text, sound_keyword):
+            return {"action_type": "sound", "sound_keyword": sound_keyword}
+    return None
+
+
+def command_vocabulary():
+    """
+    Returns the words the local parser understands (wake word, moves, speeds, sounds),
+    e.g. to constrain an on-device speech recognizer to the command grammar.
+    """
+    phrases = {WAKE_WORD, "then", "and"}
+    for intent_phrases, _, _ in LOCAL_MOVE_INTENTS:
+        phrases.update(intent_phrases)
+    phrases.update(FAST_WORDS + SLOW_WORDS)
+    phrases.update(NUMBER_WORDS)
+    phrases.update(STEP_WORDS + DEGREE_WORDS)
+    phrases.update(buzzer.SOUND_MAP)
+    return sorted(phrases)
+
+
+def _local_fallback(user_input, is_command, error_text):
+    """Builds the result used when Gemini could not answer in time."""
+    if is_command:
+        # "walk then stop" -> one step per clause, skipping clauses that don't parse
+        clauses = re.split(r'\bthen\b|,', user_input.lower())
+        steps = [a for a in (parse_local_intent(c) for c in clauses if c.strip()) if a][:MAX_PLAN_STEPS]
+        if steps:
+            print(f"Local intent parser steps: {steps}")
+            return interpretation_result(steps)
+    return {"type": "error", "text": error_text}
 
 
 # --- Sound Playing Helper ---
 
 def play_robot_sound(sound_keyword):
     """Plays a sound based on the keyword using the buzzer module."""
-    if not hardware_initialized or not buzzer_pwm:
+    if not hardware_initialized or not subsystem_ready('buzzer') or not buzzer_pwm:
         print("Warning: Hardware/Buzzer not initialized. Cannot play sound.")
         return
 
     print(f"Playing sound for keyword: '{sound_keyword}'")
+    set_face_expression(SOUND_TO_EXPRESSION.get(str(sound_keyword).lower()))
     sound_action = buzzer.SOUND_MAP.get(str(sound_keyword).lower()) # Ensure keyword is string and lowercase
 
     if sound_action is None:
@@ -336,7 +987,7 @@ def play_robot_sound(sound_keyword):
         elif sound_action == buzzer.SOUND_EXCITING_IDENTIFIER:
             buzzer.play_exciting_trill(buzzer_pwm)
         elif isinstance(sound_action, list):
-            buzzer.play_sequence(buzzer_pwm, sound_action)
+            buzzer.play_compiled(buzzer_pwm, *buzzer.COMPILED_SOUNDS[str(sound_keyword).lower()])
         else:
              # Should not happen if SOUND_MAP check passed, but as fallback:
              print(f"Warning: Unknown sound action type for '{sound_keyword}'.")
@@ -349,7 +1000,7 @@ def play_robot_sound(sound_keyword):
 
 def distance_checker():
     """Thread function to periodically check distance and stop if obstacle detected."""
-    global keep_distance_checking, is_continuous_moving
+    global keep_distance_checking, is_continuous_moving, last_obstacle_time
     print("Distance checker thread started.")
     last_warning_time = 0
     warning_interval = 3.0 # Time between danger sounds if obstacle persists
@@ -376,11 +1027,14 @@ def distance_checker():
             break # Stop checking if sensor fails
         elif 0 <= dist < DISTANCE_THRESHOLD_CM: # Check if distance is valid and below threshold
             print(f"!!! OBSTACLE DETECTED at {dist:.1f} cm !!!")
+            last_obstacle_time = time.monotonic()
+            set_face_expression('scary')
 
             # --- Stop Robot and Play Sound (Requirement 4) ---
             print("Stopping movement due to obstacle.")
             play_robot_sound('stop') # Play the stop sound
             # It's crucial to call movements.stop() which sets the flag and stops servos
+            plan_cancel_event.set() # Abandon the rest of any running plan
             if is_continuous_moving: # Check flag before calling stop again
                 movements.stop() # This sets the internal flag and stops servos
             is_continuous_moving = False # Update core state flag
@@ -401,11 +1055,90 @@ def distance_checker():
     print("Distance checker thread finished.")
 
 
+def _update_distance_check(forward):
+    """Runs the distance checker only while moving forward (walk/run, or drive with linear > 0)."""
+    global distance_check_thread, keep_distance_checking
+    if not forward:
+        keep_distance_checking = False # No distance check for backward/rotate
+        return
+    if not subsystem_ready('distance'):
+        print("Warning: Distance sensor unavailable. Moving without obstacle check.")
+        keep_distance_checking = False
+        return
+    if keep_distance_checking and distance_check_thread and distance_check_thread.is_alive():
+        return # Already checking
+    if distance_check_thread and distance_check_thread.is_alive():
+        distance_check_thread.join(timeout=0.5) # Let a finishing checker exit first
+    keep_distance_checking = True
+    distance_check_thread = threading.Thread(target=distance_checker, daemon=True)
+    distance_check_thread.start()
+
+
+def _stop_continuous(settle_pose='stand'):
+    """Stops the distance checker and the continuous movement thread, then settles into settle_pose."""
+    global movement_thread, distance_check_thread, is_continuous_moving, keep_distance_checking
+    keep_distance_checking = False
+    if distance_check_thread and distance_check_thread.is_alive():
+         distance_check_thread.join(timeout=0.5) # Wait briefly
+    distance_check_thread = None
+    movements.stop(settle_pose=settle_pose)
+    if movement_thread and movement_thread.is_alive():
+         movement_thread.join(timeout=1.0) # Wait for thread to finish
+    movement_thread = None
+    is_continuous_moving = False
+
+
+# --- Differential Drive ---
+
+def drive(linear, angular):
+    """
+    Tire-mode driving with a (linear, angular) velocity in [-1, 1] (angular > 0 turns left).
+    Meant to be streamed (e.g. from a joystick) at up to 50 Hz: while the tire gait runs,
+    a call only updates its velocity. Returns False if the servos are not available.
+    """
+    global movement_thread, is_continuous_moving, continuous_move_name
+    linear = max(-1.0, min(1.0, float(linear)))
+    angular = max(-1.0, min(1.0, float(angular)))
+    if not hardware_initialized or subsystem_state['servos'] != 'ready':
+        return False
+    if linear > 0 and time.monotonic() - last_obstacle_time < DRIVE_OBSTACLE_HOLD:
+        linear = 0.0 # Don't drive straight back into the obstacle that just stopped us
+    if (linear or angular) and plan_thread and plan_thread.is_alive():
+        cancel_plan() # The stick takes over; outside the lock, the plan thread may be waiting for it
+
+    with drive_lock:
+        running = is_continuous_moving and movement_thread and movement_thread.is_alive()
+        if running and movements.can_update_movement(continuous_move_name, 'drive'):
+            movements.set_drive(linear, angular)
+            continuous_move_name = 'drive'
+        else:
+            if linear == 0 and angular == 0:
+                return True # Idle stick: nothing to start
+            if is_continuous_moving:
+                _stop_continuous('tire')
+            is_continuous_moving = True
+            continuous_move_name = 'drive'
+            movements.stop_movement = False
+            movement_thread = threading.Thread(target=_run_movement, args=(movements.drive, linear, angular), daemon=True)
+            movement_thread.start()
+        _update_distance_check(linear > 0 and subsystem_ready('distance', timeout=0))
+    return True
+
+
 # --- Action Execution (Modified) ---
 
 def execute_action(action_data):
     """Executes the robot action based on the parsed 'action' data from Gemini."""
-    global movement_thread, distance_check_thread, is_continuous_moving, keep_distance_checking
+    cancel_plan() # A new command replaces whatever routine was running
+    _execute_action(action_data)
+
+
+def _execute_action(action_data, cancel_event=None):
+    """
+    Executes one action (shared by execute_action and the plan runner).
+    cancel_event: the plan's cancel event; a cancelled step is skipped.
+    """
+    wait_for_startup_sequence()
 
     if not hardware_initialized:
         print("Error: Hardware not initialized. Cannot execute action.")
@@ -417,24 +1150,41 @@ def execute_action(action_data):
     sound_keyword = action_data.get("sound_keyword")
     speed = action_data.get("speed", "normal")
 
-    is_new_continuous = action_type in ["move", "combo"] and move_func_name in [
-        "walk", "stepback", "run", "runback", "rotateleft", "rotateright"
-    ]
+    # Sounds only need the buzzer (play_robot_sound checks it); anything that moves needs the servos
+    if action_type in ["move", "combo", "servo"] and not subsystem_ready('servos'):
+        print("Error: Servos are not available. Cannot execute movement.")
+        play_robot_sound('no')
+        return
+
+    with drive_lock: # drive() starts and stops movements too
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        _perform_action(action_data, action_type, move_func_name, sound_keyword, speed)
+
+
+def _perform_action(action_data, action_type, move_func_name, sound_keyword, speed):
+    """Starts, updates or stops movements for one action (call with drive_lock held)."""
+    global movement_thread, is_continuous_moving, keep_distance_checking, continuous_move_name
+    # Bounded moves (N steps, X degrees, T seconds) also run in the movement thread, so 'stop' still works
+    bounds = movement_bounds(action_data) if action_type in ["move", "combo"] else {}
+    is_new_continuous = action_type in ["move", "combo"] and (move_func_name in movements.CONTINUOUS_MOVEMENTS or bool(bounds))
     is_new_finite_move = action_type in ["move", "combo", "servo"] and not is_new_continuous and move_func_name != "stop"
 
+    # Same gait, new speed or direction: the running thread picks it up at its next phase
+    if (is_new_continuous and not bounds and is_continuous_moving and movement_thread and movement_thread.is_alive()
+            and movements.can_update_movement(continuous_move_name, move_func_name)):
+        if action_type == "combo" and sound_keyword:
+            play_robot_sound(sound_keyword)
+        movements.update_movement(move_func_name, speed)
+        continuous_move_name = move_func_name
+        _update_distance_check(move_func_name in ["walk", "run"])
+        return
+
     # Stop previous continuous movement if a new move/servo command arrives
     if (is_new_continuous or is_new_finite_move) and is_continuous_moving:
         print("Stopping previous continuous movement before starting new action.")
-        keep_distance_checking = False
-        if distance_check_thread and distance_check_thread.is_alive():
-             distance_check_thread.join(timeout=0.5) # Wait briefly
-        distance_check_thread = None
-        movements.stop() # This sets the flag and stops servos
-        if movement_thread and movement_thread.is_alive():
-             movement_thread.join(timeout=1.0) # Wait for thread to finish
-        movement_thread = None
-        is_continuous_moving = False
-        time.sleep(0.2) # Pause before starting new action
+        # Settle straight into the new movement's entry pose (tire -> tire needs no motion)
+        _stop_continuous(movements.entry_pose(move_func_name))
 
     try:
         # --- Play sound specified by Gemini FIRST (if combo/sound type) ---
@@ -450,34 +1200,25 @@ def execute_action(action_data):
             target_func = getattr(movements, move_func_name, None)
             if target_func:
                 print(f"Executing movement: {move_func_name} (Speed: {speed})")
-                if move_func_name in ["walk", "stepback", "run", "runback", "rotateleft", "rotateright"]:
-                    # Start continuous movement in a new thread
+                if is_new_continuous:
+                    # Start continuous (or bounded) movement in a new thread
                     if not is_continuous_moving: # Ensure not already moving
                         is_continuous_moving = True
+                        continuous_move_name = move_func_name
                         movements.stop_movement = False # Reset the library's stop flag
-                        movement_thread = threading.Thread(target=target_func, args=(speed, None), daemon=True)
+                        movement_thread = threading.Thread(target=_run_movement, args=(target_func, speed, None), kwargs=bounds, daemon=True)
                         movement_thread.start()
-                        # Start distance checker only for forward movements
-                        if move_func_name in ["walk", "run"]:
-                             keep_distance_checking = True
-                             distance_check_thread = threading.Thread(target=distance_checker, daemon=True)
-                             distance_check_thread.start()
-                        else:
-                             keep_distance_checking = False # No distance check for backward/rotate
+                        _update_distance_check(move_func_name in ["walk", "run"])
                     else: print("Warning: Tried to start continuous move while flag indicates already moving.")
 
                 elif move_func_name == "stop":
                     # Explicit stop command
                     print("Executing stop command.")
-                    keep_distance_checking = False # Stop distance check first
-                    if distance_check_thread and distance_check_thread.is_alive(): distance_check_thread.join(timeout=0.5)
-                    movements.stop() # Tell movement library to stop
-                    if movement_thread and movement_thread.is_alive(): movement_thread.join(timeout=1.0) # Wait for thread
-                    is_continuous_moving = False # Update core state flag
+                    _stop_continuous() # Distance check first, then the movement thread
                 else:
                     # Finite movements (hello, turn steps, reset, rest)
                     if not is_continuous_moving:
-                        target_func() if move_func_name in ["hello", "reset_servos", "rest"] else target_func(speed, None)
+                        target_func() if movements.MOVEMENTS.get(move_func_name, ('pose',))[0] == 'pose' else target_func(speed, None)
                     else:
                         # This case should ideally be prevented by the check at the start
                         print(f"Warning: Cannot perform '{move_func_name}' while continuous movement active. Stop first.")
@@ -529,6 +1270,71 @@ def execute_action(action_data):
         traceback.print_exc()
 
 
+def _run_movement(target_func, *args, **kwargs):
+    """
+    Movement thread: runs the movement. One that ends by itself (a bounded move, or a drive
+    left at zero velocity) clears the moving state.
+    """
+    global is_continuous_moving, keep_distance_checking
+    target_func(*args, **kwargs)
+    if movement_thread is threading.current_thread() and not movements.stop_movement:
+        print(f"Movement {target_func.__name__} {kwargs or args} finished by itself.")
+        keep_distance_checking = False
+        is_continuous_moving = False
+
+
+# --- Multi-step Plan Execution ---
+
+def execute_plan(steps):
+    """
+    Runs a list of actions in a background thread with local timing.
+    Returns immediately; a new command, 'stop' or an obstacle cancels the rest of the plan.
+    """
+    global plan_thread, plan_cancel_event
+    if not hardware_initialized:
+        print("Error: Hardware not initialized. Cannot execute plan.")
+        return
+    cancel_plan()
+    plan_cancel_event = threading.Event()
+    plan_thread = threading.Thread(target=_run_plan, args=(steps, plan_cancel_event), daemon=True)
+    plan_thread.start()
+
+
+def cancel_plan():
+    """Stops a running plan before its next step."""
+    global plan_thread
+    plan_cancel_event.set()
+    if plan_thread and plan_thread.is_alive() and plan_thread is not threading.current_thread():
+        plan_thread.join(timeout=1.0)
+    plan_thread = None
+
+
+def _run_plan(steps, cancel_event):
+    """Plan thread: executes each step, holding continuous moves for their duration."""
+    print(f"Starting plan with {len(steps)} steps.")
+    for i, step in enumerate(steps):
+        if cancel_event.is_set():
+            break
+        print(f"Plan step {i + 1}/{len(steps)}: {step}")
+        _execute_action(step, cancel_event)
+
+        if movement_bounds(step): # Timed locally by the movement itself; wait until it has finished
+            thread = movement_thread
+            while thread and thread.is_alive():
+                if cancel_event.wait(0.05):
+                    break
+            if cancel_event.is_set():
+                break
+
+        wait = step.get("wait")
+        if wait and cancel_event.wait(wait):
+            break
+    if cancel_event.is_set():
+        print("Plan cancelled.")
+    else:
+        print("Plan finished.")
+
+
 # --- NEW Main Processing Function ---
 
 def process_user_input(user_input_text):
@@ -563,6 +1369,11 @@ def process_user_input(user_input_text):
 def get_robot_status():
     """Returns a simple string indicating the robot's movement state."""
     if not hardware_initialized: return "Hardware Not Initialized"
+    starting = [name for name in SUBSYSTEMS if subsystem_state[name] == 'starting']
+    if starting: return f"Starting up ({', '.join(starting)} pending)"
+    if subsystem_state['servos'] != 'ready': return "Servos unavailable"
+    if plan_thread and plan_thread.is_alive():
+        return "Executing multi-step plan"
     if is_continuous_moving:
         if movement_thread and movement_thread.is_alive():
             # Check if distance checker is active (only for fwd moves)
@@ -573,6 +1384,7 @@ def get_robot_status():
                  status += " (no distance check)"
             return status
         else: return "Movement thread stopped unexpectedly."
+    elif movements.servos_relaxed(): return "Idle (servos powered down)"
     else: return "Idle / Standing"
 
 # --- END OF FILE ninja_core.py ---
@@ -2,40 +2,91 @@
 # Filename: web_interface.py
 
 import os
-import subprocess
+import json
 import time
-import sys # <-------------------- ADD THIS LINE
+import threading
 from flask import Flask, render_template, jsonify, request, Response
+import Ninja_Voice_Control as voice # Runs in this process; hardware, Gemini and audio stay warm
+import Ninja_Teleop
+
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+    websocket_available = True
+except ImportError:
+    print("Warning: 'flask-sock' not installed. The drive joystick falls back to HTTP (/drive).")
+    websocket_available = False
 
 # --- Configuration ---
-VOICE_SCRIPT_NAME = "Ninja_Voice_Control.py"
-LOG_FILE_NAME = "conversation.log"
-STOP_FLAG_FILE = "stop_voice.flag" # Must match the one in Ninja_Voice_Control.py
+LOG_FILE_NAME = voice.CONVERSATION_LOG_FILE
 MAX_LOG_LINES_TO_SHOW = 30 # How many recent lines to display
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__)) # Directory of this script
 
-# --- Global Variable for Process ---
-voice_process = None
+# --- Global Variables for the Robot ---
+robot_state = "off" # "starting" -> "ready" or "failed"
+voice_active = threading.Event() # Set while voice control is on
+voice_thread = None
+teleop_channel = None # Ninja_Teleop.TeleopChannel of the controller currently driving
+teleop_lock = threading.Lock()
 
 # --- Flask App Setup ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_here' # Change this for security if needed
+sock = Sock(app) if websocket_available else None
 
 # --- Helper Functions ---
 
+def start_robot():
+    """
+    Initializes hardware, Gemini and audio once, in the background, then starts the
+    voice loop idle. Turning voice control on/off afterwards only flips voice_active.
+    """
+    global robot_state
+    robot_state = "starting"
+
+    def bring_up():
+        global robot_state, voice_thread
+        if not voice.initialize_all():
+            robot_state = "failed"
+            return
+        voice_thread = threading.Thread(target=voice.run_voice_loop, args=(voice_active,), name="voice-loop", daemon=True)
+        voice_thread.start()
+        robot_state = "ready"
+        print("Robot ready. Voice control can be started from the web page.")
+
+    threading.Thread(target=bring_up, name="robot-startup", daemon=True).start()
+
+
 def is_voice_script_running():
-    """Checks if the voice control process is running."""
-    global voice_process
-    if voice_process and voice_process.poll() is None:
-        return True
-    # Check if flag exists but process handle is lost (e.g. Flask restarted)
-    stop_flag_path = os.path.join(SCRIPT_DIR, STOP_FLAG_FILE)
-    if not os.path.exists(stop_flag_path):
-         # If the flag *doesn't* exist, the script *might* be running orphan.
-         # This is harder to detect reliably without PID checking.
-         # For simplicity, we'll mainly rely on the process handle.
-         pass
-    return False
+    """Checks if voice control is switched on."""
+    return voice_active.is_set()
+
+
+def open_teleop_channel(replace=True, on_error=None):
+    """
+    Returns the teleop channel, starting a new one if there is none or replace is True
+    (a new WebSocket connection takes over from the previous controller).
+    on_error(seq, message) of a new channel reports drive failures (see Ninja_Teleop).
+    """
+    global teleop_channel
+    with teleop_lock:
+        if teleop_channel and replace:
+            teleop_channel.close()
+            teleop_channel = None
+        if teleop_channel is None:
+            teleop_channel = Ninja_Teleop.TeleopChannel(voice.ninja_core.drive, on_error=on_error)
+            teleop_channel.start()
+        return teleop_channel
+
+
+def close_teleop_channel(channel):
+    """Closes channel unless another controller has already taken over (and closed it)."""
+    global teleop_channel
+    with teleop_lock:
+        if teleop_channel is not channel:
+            return
+        teleop_channel = None
+    channel.close()
 
 
 def read_log_file():
@@ -62,19 +113,13 @@ def index():
 
 @app.route('/start_voice', methods=['POST'])
 def start_voice():
-    """Starts the Ninja_Voice_Control.py script."""
-    global voice_process
+    """Switches voice control on (the robot is already initialized)."""
+    if robot_state != "ready":
+        return jsonify({"status": "error", "message": f"Robot is not ready yet (state: {robot_state})."}), 503
     if is_voice_script_running():
         return jsonify({"status": "error", "message": "Voice control is already running."}), 400
 
-    # Clear any previous stop flag
-    stop_flag_path = os.path.join(SCRIPT_DIR, STOP_FLAG_FILE)
-    if os.path.exists(stop_flag_path):
-        try:
-            os.remove(stop_flag_path)
-        except OSError as e:
-            print(f"Warning: Could not remove existing stop flag: {e}")
-
+    start_time = time.monotonic()
     # Clear the log file before starting
     log_path = os.path.join(SCRIPT_DIR, LOG_FILE_NAME)
     try:
@@ -82,57 +127,77 @@ def start_voice():
     except Exception as e:
          print(f"Warning: Could not clear log file: {e}")
 
-
-    script_path = os.path.join(SCRIPT_DIR, VOICE_SCRIPT_NAME)
-    if not os.path.exists(script_path):
-         return jsonify({"status": "error", "message": f"{VOICE_SCRIPT_NAME} not found."}), 500
-
-    try:
-        print(f"Starting {VOICE_SCRIPT_NAME}...")
-        # Run the script using the python interpreter in the virtual env if applicable
-        # Modify python executable path if needed e.g. /home/pi/my_venv/bin/python3
-        python_executable = sys.executable # <--- This line needs 'import sys'
-        # Start the process without capturing stdout/stderr directly here
-        # Let it run in the background and write to its own console/log
-        voice_process = subprocess.Popen([python_executable, script_path], cwd=SCRIPT_DIR)
-        time.sleep(2) # Give script time to initialize
-        if voice_process.poll() is not None: # Check if it exited immediately
-             process_return_code = voice_process.returncode
-             print(f"Script exited immediately with code: {process_return_code}")
-             # You could try reading stderr/stdout here if needed for debugging
-             # stdout, stderr = voice_process.communicate()
-             # print("Script stdout:", stdout)
-             # print("Script stderr:", stderr)
-             return jsonify({"status": "error", "message": f"Script failed to start or exited quickly (code: {process_return_code}). Check console."}), 500
-        print(f"Script started with PID: {voice_process.pid}")
-        return jsonify({"status": "success", "message": "Voice control started."})
-    except Exception as e:
-        print(f"Error starting voice script: {e}")
-        return jsonify({"status": "error", "message": f"Failed to start script: {e}"}), 500
+    voice.log_conversation("System", "Ninja robot ready and listening.")
+    voice_active.set()
+    elapsed_ms = (time.monotonic() - start_time) * 1000
+    print(f"Voice control started ({elapsed_ms:.1f} ms).")
+    return jsonify({"status": "success", "message": "Voice control started.", "elapsed_ms": elapsed_ms})
 
 @app.route('/stop_voice', methods=['POST'])
 def stop_voice():
-    """Signals the Ninja_Voice_Control.py script to stop by creating a flag file."""
-    global voice_process
-    # Check process handle *first* before resorting to just flag creation
+    """Switches voice control off. Hardware, Gemini and audio stay initialized."""
     if not is_voice_script_running():
-         print("Stop signal requested, but process not tracked or already stopped.")
-         # Still try creating the flag file in case the script is orphaned
-         # but maybe return a different status?
-         # return jsonify({"status": "warning", "message": "Voice control appears stopped, but sent signal anyway."})
-
-
-    stop_flag_path = os.path.join(SCRIPT_DIR, STOP_FLAG_FILE)
+        return jsonify({"status": "warning", "message": "Voice control is already stopped."})
+
+    start_time = time.monotonic()
+    voice_active.clear() # The loop ignores anything heard after this and goes idle
+    voice.log_conversation("System", "Voice control stopped.")
+    elapsed_ms = (time.monotonic() - start_time) * 1000
+    print(f"Voice control stopped ({elapsed_ms:.1f} ms).")
+    return jsonify({"status": "success", "message": "Voice control stopped.", "elapsed_ms": elapsed_ms})
+
+@app.route('/drive', methods=['POST'])
+def drive():
+    """
+    HTTP fallback of the /teleop WebSocket: {"seq": n, "linear": -1..1, "angular": -1..1,
+    "session": id} (angular > 0 turns left). Shares the coalescing and dead-man timeout of
+    the WebSocket. Frames are applied asynchronously, so a failure is returned with the next
+    request, together with the seq of the frame that failed.
+    """
+    if robot_state != "ready" or not voice.ninja_core:
+        return jsonify({"status": "error", "message": f"Robot is not ready yet (state: {robot_state})."}), 503
+    data = request.get_json(silent=True) or {}
     try:
-        print(f"Creating stop flag: {stop_flag_path}")
-        with open(stop_flag_path, 'w') as f:
-            f.write('stop') # Write something to the file
-        # Don't clear voice_process here yet, let the script terminate.
-        # The is_voice_script_running() check will eventually return false.
-        return jsonify({"status": "success", "message": "Stop signal sent. Please wait for cleanup."})
-    except Exception as e:
-        print(f"Error creating stop flag: {e}")
-        return jsonify({"status": "error", "message": f"Failed to send stop signal: {e}"}), 500
+        seq = int(data["seq"])
+        linear = float(data.get("linear", 0.0))
+        angular = float(data.get("angular", 0.0))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"status": "error", "message": "seq, linear and angular must be numbers."}), 400
+    channel = open_teleop_channel(replace=False)
+    channel.submit(seq, linear, angular, session=data.get("session"))
+    error = channel.take_error()
+    if error:
+        return jsonify({"status": "error", "message": error[1], "seq": error[0]}), 503
+    return jsonify({"status": "success"})
+
+if websocket_available:
+    @sock.route('/teleop')
+    def teleop(ws):
+        """Joystick WebSocket: short JSON frames, see Ninja_Teleop.py."""
+        if robot_state != "ready" or not voice.ninja_core:
+            ws.send('{"t": "e", "m": "Robot is not ready yet."}')
+            return
+        send_lock = threading.Lock() # Replies and the worker's error frames share the socket
+        def send(frame):
+            with send_lock:
+                ws.send(frame)
+        def report_error(seq, message):
+            try:
+                send(json.dumps({"t": "e", "m": message, "s": seq}))
+            except (ConnectionClosed, OSError):
+                pass # The receive loop notices the closed connection
+        channel = open_teleop_channel(on_error=report_error)
+        print("Teleop controller connected.")
+        try:
+            while True:
+                reply = channel.handle_frame(ws.receive())
+                if reply:
+                    send(reply)
+        except ConnectionClosed:
+            pass
+        finally:
+            close_teleop_channel(channel) # Stops the wheels if the connection dropped mid-drive
+            print("Teleop controller disconnected.")
 
 @app.route('/status')
 def status():
@@ -141,6 +206,10 @@ def status():
     running = is_voice_script_running()
     return jsonify({
         "running": running,
+        "robot_state": robot_state,
+        "http_connections": voice.ninja_http.connection_stats() if voice.ninja_http else {},
+        "hardware": voice.ninja_core.get_hardware_stats() if voice.ninja_core else {},
+        "teleop": teleop_channel.stats() if teleop_channel else {},
         "log_content": log_content
     })
 
@@ -149,4 +218,12 @@ if __name__ == '__main__':
     # Make Flask accessible on the local network
     # Use port 5000 by default (http://<pi_ip_address>:5000)
     # Use threaded=True to handle multiple requests (like status polling) better
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    os.chdir(SCRIPT_DIR) # Log and cache files are relative to this directory
+    start_robot()
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    finally:
+        voice_active.clear()
+        if teleop_channel:
+            teleop_channel.close()
+        voice.cleanup() # Shutdown sequence and GPIO cleanup
@@ -0,0 +1,102 @@
+# face_player.py
+import time
+import queue
+import threading
+
+class FacePlayer:
+    """
+    Plays RobotFace expressions in a background thread so callers never block.
+    Expression commands arrive through a queue; the newest one always wins.
+    Frames are shown at absolute deadlines, capped at the target FPS, and
+    frames that are already late are dropped instead of slowing the animation.
+    """
+    def __init__(self, face, fps=30):
+        self.face = face
+        self.frame_interval = 1.0 / fps
+        self._commands = queue.Queue()
+        self._thread = None
+        self._running = False
+        self.current_expression = None
+        # Statistics
+        self.frames_shown = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        """Starts the renderer thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="face-player", daemon=True)
+        self._thread.start()
+        print(f"Face player started ({1.0 / self.frame_interval:.0f} FPS target).")
+
+    def stop(self):
+        """Stops the renderer thread (the last frame stays on screen)."""
+        self._running = False
+        self._commands.put(None) # Wake the thread up
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        print(f"Face player stopped ({self.frames_shown} frames shown, {self.frames_dropped} dropped).")
+
+    def set_expression(self, expression):
+        """Queues an expression (see RobotFace.EXPRESSIONS). Returns immediately."""
+        if expression not in self.face.EXPRESSIONS:
+            print(f"Warning: Unknown face expression '{expression}'.")
+            return
+        self._commands.put(expression)
+
+    def _next_command(self, timeout):
+        """Waits up to timeout for a command and returns the newest one queued."""
+        try:
+            command = self._commands.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        while True: # Drain: only the latest expression matters
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return command
+
+    def _run(self):
+        """Renderer thread: frame scheduler driven by absolute deadlines."""
+        frames = [] # (frame_name, start_time) for the active timeline
+        index = 0
+        next_allowed = 0.0 # Earliest time the next frame may be sent (FPS cap)
+
+        while self._running:
+            now = time.monotonic()
+            if index < len(frames):
+                timeout = max(0.0, max(frames[index][1], next_allowed) - now)
+            else:
+                timeout = None # Idle until the next command
+
+            command = self._next_command(timeout)
+            if not self._running:
+                break
+            if command:
+                self.current_expression = command
+                # Convert hold times into absolute start times
+                start_time = time.monotonic()
+                frames = []
+                for frame_name, hold in self.face.timeline(command):
+                    frames.append((frame_name, start_time))
+                    start_time += hold
+                index = 0
+
+            now = time.monotonic()
+            if index >= len(frames) or frames[index][1] > now or next_allowed > now:
+                continue
+
+            # Behind schedule: skip to the newest frame that is already due
+            while index + 1 < len(frames) and frames[index + 1][1] <= now:
+                index += 1
+                self.frames_dropped += 1
+
+            try:
+                self.face.show_frame(frames[index][0])
+                self.frames_shown += 1
+            except Exception as e:
+                print(f"Error displaying face frame: {e}")
+            index += 1
+            next_allowed = now + self.frame_interval
@@ -9,7 +9,33 @@ class WaveshareLCD:
     """
     A corrected, validated driver for the Waveshare 2-inch LCD Module.
     This version fixes a critical data transfer bug and works in portrait mode.
+    Only the regions that changed since the previous frame are sent over SPI.
     """
+    # Dirty-rectangle tuning
+    DIRTY_BAND_GAP = 8 # Changed rows closer than this are merged into one region
+    DIRTY_FULL_FRAME_RATIO = 0.5 # Above this fraction of the screen, send the whole frame
+
+    # ST7789V initialization: (command, parameter bytes, delay after in seconds).
+    # Each entry is sent as one command byte plus one parameter transfer.
+    INIT_SEQUENCE = (
+        (0x36, [0x00], 0), # Memory access control: default portrait mode
+        (0x3A, [0x05], 0), # Pixel format: 16-bit RGB565
+        (0xB2, [0x0C, 0x0C, 0x00, 0x33, 0x33], 0), # Porch control
+        (0xB7, [0x35], 0), # Gate control
+        (0xBB, [0x19], 0), # VCOM setting
+        (0xC0, [0x2C], 0), # LCM control
+        (0xC2, [0x01], 0), # VDV/VRH command enable
+        (0xC3, [0x12], 0), # VRH set
+        (0xC4, [0x20], 0), # VDV set
+        (0xC6, [0x0F], 0), # Frame rate control
+        (0xD0, [0xA4, 0xA1], 0), # Power control
+        (0xE0, [0xD0, 0x04, 0x0D, 0x11, 0x13, 0x2B, 0x3F, 0x54, 0x4C, 0x18, 0x0D, 0x0B, 0x1F, 0x23], 0), # Positive gamma
+        (0xE1, [0xD0, 0x04, 0x0C, 0x11, 0x13, 0x2C, 0x3F, 0x44, 0x51, 0x2F, 0x1F, 0x1F, 0x20, 0x23], 0), # Negative gamma
+        (0x21, [], 0), # Display inversion on
+        (0x11, [], 0.12), # Sleep out
+        (0x29, [], 0), # Display on
+    )
+
     def __init__(self, rst_pin=17, dc_pin=25, bl_pin=18, cs_pin=8, spi_bus=0, spi_device=0):
         # Pin configuration (BCM numbering)
         self.RST_PIN = rst_pin
@@ -20,6 +46,16 @@ class WaveshareLCD:
         # This driver works in portrait mode (240x320)
         self.width = 240
         self.height = 320
+        # Last RGB565 frame sent to the panel (None forces a full refresh)
+        self._frame = None
+
+        # Reusable conversion buffers, allocated once. Two output frames are
+        # alternated so the previous frame stays intact for dirty-rectangle diffing.
+        shape = (self.height, self.width)
+        self._work = np.empty(shape, dtype=np.uint16)
+        self._work_tmp = np.empty(shape, dtype=np.uint16)
+        self._changed = np.empty(shape, dtype=bool)
+        self._out_buffers = [np.empty(shape, dtype='>H'), np.empty(shape, dtype='>H')]
 
         # Initialize GPIO
         GPIO.setmode(GPIO.BCM)
@@ -48,10 +84,13 @@ class WaveshareLCD:
         GPIO.output(self.DC_PIN, GPIO.HIGH)
         self.spi.writebytes([data])
 
-    def _data_word(self, data):
-        """Sends a 16-bit data word."""
-        GPIO.output(self.DC_PIN, GPIO.HIGH)
-        self.spi.writebytes([(data >> 8) & 0xFF, data & 0xFF])
+    def _send(self, cmd, params=None):
+        """Sends a command and all of its parameter bytes in a single data transfer."""
+        GPIO.output(self.DC_PIN, GPIO.LOW)
+        self.spi.writebytes([cmd])
+        if params:
+            GPIO.output(self.DC_PIN, GPIO.HIGH)
+            self.spi.writebytes(params)
 
     def _reset(self):
         """Performs a hardware reset of the display."""
@@ -64,55 +103,123 @@ class WaveshareLCD:
 
     def init_display(self):
         """Initializes the ST7789V controller with a standard command sequence."""
+        self._frame = None
         self._reset()
         self.backlight_on()
 
-        self._command(0x36); self._data(0x00) # Set to default portrait mode
-        self._command(0x3A); self._data(0x05)
-        self._command(0xB2); self._data(0x0C); self._data(0x0C); self._data(0x00); self._data(0x33); self._data(0x33)
-        self._command(0xB7); self._data(0x35)
-        self._command(0xBB); self._data(0x19)
-        self._command(0xC0); self._data(0x2C)
-        self._command(0xC2); self._data(0x01)
-        self._command(0xC3); self._data(0x12)
-        self._command(0xC4); self._data(0x20)
-        self._command(0xC6); self._data(0x0F)
-        self._command(0xD0); self._data(0xA4); self._data(0xA1)
-        self._command(0xE0); self._data(0xD0); self._data(0x04); self._data(0x0D); self._data(0x11); self._data(0x13); self._data(0x2B); self._data(0x3F); self._data(0x54); self._data(0x4C); self._data(0x18); self._data(0x0D); self._data(0x0B); self._data(0x1F); self._data(0x23)
-        self._command(0xE1); self._data(0xD0); self._data(0x04); self._data(0x0C); self._data(0x11); self._data(0x13); self._data(0x2C); self._data(0x3F); self._data(0x44); self._data(0x51); self._data(0x2F); self._data(0x1F); self._data(0x1F); self._data(0x20); self._data(0x23)
-        self._command(0x21)
-        self._command(0x11)
-        time.sleep(0.12)
-        self._command(0x29)
+        for cmd, params, delay in self.INIT_SEQUENCE:
+            self._send(cmd, params)
+            if delay:
+                time.sleep(delay)
         self.clear()
 
     def set_window(self, x_start, y_start, x_end, y_end):
         """Sets the drawing window area on the display."""
-        self._command(0x2A); self._data_word(x_start); self._data_word(x_end)
-        self._command(0x2B); self._data_word(y_start); self._data_word(y_end)
-        self._command(0x2C) # Memory Write
+        self._send(0x2A, [x_start >> 8, x_start & 0xFF, x_end >> 8, x_end & 0xFF]) # Column range
+        self._send(0x2B, [y_start >> 8, y_start & 0xFF, y_end >> 8, y_end & 0xFF]) # Row range
+        self._send(0x2C) # Memory Write
 
-    def display(self, image):
+    def display(self, image, full=False):
         """
         Takes a Pillow Image object, converts it to the correct format, and displays
-        it on the screen. This method contains the critical data transfer bug fix.
+        it on the screen. Only the changed regions are sent unless full=True.
+        A (height, width) uint16 NumPy array already in RGB565 is also accepted.
         """
+        # Convert into whichever output buffer is not holding the previous frame
+        out = self._out_buffers[0] if self._frame is not self._out_buffers[0] else self._out_buffers[1]
+        self.display_frame(self.to_rgb565(image, out=out), full=full)
+
+    def to_rgb565(self, image, out=None):
+        """
+        Converts a Pillow Image into a (height, width) big-endian RGB565 frame.
+        With out=None a new array is returned (e.g. for caching); otherwise the
+        result is written into out, and no full-frame temporaries are allocated.
+        """
+        if out is None:
+            out = np.empty((self.height, self.width), dtype='>H')
+
+        # Fast path: data that is already RGB565 only needs the byte order fixed
+        if isinstance(image, np.ndarray):
+            if image.shape != out.shape or image.dtype.kind != 'u' or image.dtype.itemsize != 2:
+                raise ValueError(f"Expected a {out.shape} uint16 RGB565 array, got {image.shape} {image.dtype}")
+            np.copyto(out, image)
+            return out
+
         if image.width != self.width or image.height != self.height:
             image = image.resize((self.width, self.height))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        # Read-only view of the image's pixel bytes: (height, width, 3) uint8
+        pixel_data = np.asarray(image)
+        work, tmp = self._work, self._work_tmp
+        np.bitwise_and(pixel_data[:, :, 0], 0xF8, out=work)
+        np.left_shift(work, 8, out=work)
+        np.bitwise_and(pixel_data[:, :, 1], 0xFC, out=tmp)
+        np.left_shift(tmp, 3, out=tmp)
+        np.bitwise_or(work, tmp, out=work)
+        np.right_shift(pixel_data[:, :, 2], 3, out=tmp)
+        np.bitwise_or(work, tmp, out=work)
+        # BUG FIX: The panel expects big-endian 16-bit words (byteswap happens in this copy)
+        np.copyto(out, work)
+        return out
+
+    def display_frame(self, frame, full=False):
+        """
+        Displays a ready-to-send (height, width) big-endian RGB565 frame, e.g. one
+        produced by to_rgb565() or loaded from a cache. No image processing is done.
+        """
+        if full:
+            self._frame = None
+        for region in self._dirty_regions(frame):
+            self._write_region(frame, *region)
+        self._frame = frame
 
-        # Convert image to RGB565 format
-        pixel_data = np.array(image.convert("RGB")).astype('uint16')
-        color = ((pixel_data[:, :, 0] & 0xF8) << 8) | \
-                ((pixel_data[:, :, 1] & 0xFC) << 3) | \
-                (pixel_data[:, :, 2] >> 3)
-        
-        # Set the drawing window to the full screen
-        self.set_window(0, 0, self.width - 1, self.height - 1)
+    def invalidate(self):
+        """Forces the next display() call to send the full frame."""
+        self._frame = None
+
+    def _dirty_regions(self, frame):
+        """
+        Compares a frame with the previous one and returns the changed
+        bounding boxes as (x_start, y_start, x_end, y_end), inclusive.
+        """
+        full_screen = [(0, 0, self.width - 1, self.height - 1)]
+        if self._frame is None:
+            return full_screen
+
+        changed = np.not_equal(frame, self._frame, out=self._changed)
+        rows = np.flatnonzero(changed.any(axis=1))
+        if rows.size == 0:
+            return [] # Nothing changed, nothing to send
+
+        # Split changed rows into bands separated by unchanged gaps
+        breaks = np.flatnonzero(np.diff(rows) > self.DIRTY_BAND_GAP)
+        band_starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+        band_ends = np.concatenate((rows[breaks], [rows[-1]]))
+
+        regions = []
+        area = 0
+        for y_start, y_end in zip(band_starts, band_ends):
+            cols = np.flatnonzero(changed[y_start:y_end + 1].any(axis=0))
+            x_start, x_end = int(cols[0]), int(cols[-1])
+            regions.append((x_start, int(y_start), x_end, int(y_end)))
+            area += (x_end - x_start + 1) * (y_end - y_start + 1)
+
+        # Many scattered changes: one full transfer is cheaper than many windows
+        if area > self.DIRTY_FULL_FRAME_RATIO * self.width * self.height:
+            return full_screen
+        return regions
+
+    def _write_region(self, frame, x_start, y_start, x_end, y_end):
+        """Sends one rectangular region of an RGB565 frame to the display."""
+        self.set_window(x_start, y_start, x_end, y_end)
         GPIO.output(self.DC_PIN, GPIO.HIGH)
-        
-        # BUG FIX: Convert the 16-bit data to a proper byte array
-        # and use writebytes2 for efficient transfer.
-        self.spi.writebytes2(color.astype('>H').flatten())
+
+        # Full-width regions are already contiguous in memory and are sent as-is;
+        # narrower ones need a compact copy. writebytes2 handles large buffers.
+        region = frame[y_start:y_end + 1, x_start:x_end + 1]
+        self.spi.writebytes2(np.ascontiguousarray(region).ravel())
 
     def clear(self):
         """Clears the display to black."""
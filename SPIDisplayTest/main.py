@@ -1,8 +1,12 @@
 # main.py
 from lcd_driver import WaveshareLCD
 from robot_face import RobotFace
+from face_player import FacePlayer
 import time
 
+# Pre-rendered face frames are kept here so later starts skip the rendering step
+FACE_CACHE_FILE = "face_frames.npy"
+
 def print_commands():
     """Prints the available commands to the user."""
     print("\n--- Robot Face Expression Controller ---")
@@ -14,14 +18,19 @@ def print_commands():
 def main_loop():
     """Initializes the system and runs the main command loop."""
     lcd = None
+    player = None
     try:
         # Initialize the LCD driver
         lcd = WaveshareLCD()
         # Create an instance of our RobotFace class
-        face = RobotFace(lcd)
+        face = RobotFace(lcd, cache_file=FACE_CACHE_FILE)
         
+        # Animations run in the background, so the prompt returns immediately
+        player = FacePlayer(face)
+        player.start()
+
         # Show the default face and print commands
-        face.show_idle()
+        player.set_expression('idle')
         print_commands()
 
         # Loop forever, waiting for user input
@@ -31,24 +40,8 @@ def main_loop():
             if command == 'exit':
                 print("Exiting...")
                 break
-            elif command == 'idle':
-                face.show_idle()
-            elif command == 'happy':
-                face.show_happy()
-            elif command == 'sad':
-                face.show_sad()
-            elif command == 'angry':
-                face.show_angry()
-            elif command == 'amazing':
-                face.show_amazing()
-            elif command == 'cry':
-                face.animate_cry()
-            elif command == 'sleepy':
-                face.animate_sleepy()
-            elif command == 'confuse':
-                face.show_confuse()
-            elif command == 'scary':
-                face.show_scary()
+            elif command in face.EXPRESSIONS:
+                player.set_expression(command)
             elif command == 'help':
                 print_commands()
             else:
@@ -58,6 +51,8 @@ def main_loop():
         print("\nExiting program.")
     finally:
         # This cleanup code runs no matter how the program exits
+        if player:
+            player.stop()
         if lcd:
             print("Cleaning up resources.")
             lcd.cleanup()
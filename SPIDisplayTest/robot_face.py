@@ -1,12 +1,29 @@
 # robot_face.py
+import os
 import time
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+# Bump this whenever the drawing code changes so old cache files are rebuilt
+FACE_CACHE_VERSION = 1
+
 class RobotFace:
     """
     Uses software rotation to draw a full-screen face with enhanced, animated expressions.
+    Every expression and animation frame is rendered once at startup into a
+    ready-to-send RGB565 buffer, so changing expression is a single SPI transfer.
     """
-    def __init__(self, lcd_driver):
+    # Tear animation: y offsets of the tear for each cry frame
+    TEAR_OFFSETS = range(0, 80, 10)
+    # Names accepted by timeline() and FacePlayer.set_expression()
+    EXPRESSIONS = ('idle', 'happy', 'sad', 'angry', 'amazing', 'confuse', 'scary', 'sleepy', 'cry')
+
+    def __init__(self, lcd_driver, cache_file=None):
+        """
+        lcd_driver: WaveshareLCD instance.
+        cache_file: optional .npy path; pre-rendered frames are stored there and
+                    memory-mapped on the next start instead of being redrawn.
+        """
         self.lcd = lcd_driver
         # Define a horizontal canvas (320x240) to draw on
         self.width = 320
@@ -17,10 +34,72 @@ class RobotFace:
         except IOError:
             self.font = ImageFont.load_default()
 
-    def _display(self, image):
-        """Rotates the final horizontal image for the vertical display."""
-        rotated_image = image.rotate(-90, expand=True)
-        self.lcd.display(rotated_image)
+        self._frames = self._load_frames(cache_file)
+
+    # --- Frame Cache ---
+
+    def _frame_painters(self):
+        """Returns (name, paint_function) for every frame the face can show."""
+        painters = [
+            ('idle', self._paint_idle),
+            ('happy', self._paint_happy),
+            ('sad', self._paint_sad),
+            ('angry', self._paint_angry),
+            ('amazing', self._paint_amazing),
+            ('confuse', self._paint_confuse),
+            ('scary', self._paint_scary),
+            ('sleepy', self._paint_sleepy),
+            ('asleep', self._paint_asleep),
+        ]
+        for i, y_offset in enumerate(self.TEAR_OFFSETS):
+            painters.append((f'cry_{i}', lambda draw, y=y_offset: self._paint_cry(draw, y)))
+        return painters
+
+    def _render(self, paint):
+        """Draws one frame and converts it to a panel-oriented RGB565 buffer."""
+        image, draw = self._create_base_image()
+        paint(draw)
+        # Rotate the horizontal image for the vertical display once, at render time
+        return self.lcd.to_rgb565(image.rotate(-90, expand=True))
+
+    def _load_frames(self, cache_file):
+        """Renders all frames, or memory-maps them from cache_file if it is up to date."""
+        painters = self._frame_painters()
+        names = [name for name, _ in painters]
+        shape = (len(names), self.lcd.height, self.lcd.width)
+        if cache_file:
+            # Versioned file name, so changes to the drawing code never load stale frames
+            root, _ = os.path.splitext(cache_file)
+            cache_file = f"{root}_v{FACE_CACHE_VERSION}.npy"
+
+        if cache_file and os.path.exists(cache_file):
+            try:
+                cached = np.load(cache_file, mmap_mode='r')
+                if cached.shape == shape and cached.dtype == np.dtype('>H'):
+                    print(f"Loaded {len(names)} face frames from {cache_file}.")
+                    return dict(zip(names, cached))
+                print("Face frame cache is out of date, re-rendering.")
+            except (OSError, ValueError) as e:
+                print(f"Could not read face frame cache: {e}")
+
+        start_time = time.time()
+        frames = np.empty(shape, dtype='>H')
+        for i, (_, paint) in enumerate(painters):
+            frames[i] = self._render(paint)
+        print(f"Rendered {len(names)} face frames in {time.time() - start_time:.2f}s.")
+
+        if cache_file:
+            try:
+                np.save(cache_file, frames)
+            except OSError as e:
+                print(f"Could not write face frame cache: {e}")
+        return dict(zip(names, frames))
+
+    def _show(self, name):
+        """Sends a pre-rendered frame to the display."""
+        self.lcd.display_frame(self._frames[name])
+
+    # --- Drawing Helpers ---
 
     def _create_base_image(self):
         """Creates a blank black image canvas."""
@@ -65,93 +144,121 @@ class RobotFace:
             draw.ellipse((left_eye_x - 5, eye_y - 5, left_eye_x + 5, eye_y + 5), fill="BLACK")
             draw.ellipse((right_eye_x - 5, eye_y - 5, right_eye_x + 5, eye_y + 5), fill="BLACK")
 
-    # --- Public Methods for Each Expression ---
+    # --- Frame Painters (run once, when frames are pre-rendered) ---
 
-    def show_idle(self):
-        """Displays a neutral, blinking face."""
-        image, draw = self._create_base_image()
+    def _paint_idle(self, draw):
         pupils = [(0, 0, 15), (0, 0, 15)]
         self._draw_eyes(draw, mood='idle', pupil_data=pupils)
         draw.line((140, 180, 180, 180), fill="WHITE", width=6)
-        self._display(image)
 
-    def show_happy(self):
-        """Displays a happy face with a big smile."""
-        image, draw = self._create_base_image()
+    def _paint_happy(self, draw):
         self._draw_eyes(draw, mood='happy')
         draw.arc((100, 150, 220, 210), 0, 180, fill="WHITE", width=12)
-        self._display(image)
 
-    def show_sad(self):
-        """Displays a sad face with downturned pupils and a frown."""
-        image, draw = self._create_base_image()
+    def _paint_sad(self, draw):
         pupils = [(0, 15, 12), (0, 15, 12)] # Pupils look down
         self._draw_eyes(draw, mood='sad', pupil_data=pupils)
         draw.arc((120, 190, 200, 220), 180, 360, fill="WHITE", width=8)
-        self._display(image)
 
-    def show_angry(self):
-        """Displays an angry face."""
-        image, draw = self._create_base_image()
+    def _paint_angry(self, draw):
         pupils = [(0, 0, 18), (0, 0, 18)]
         self._draw_eyes(draw, mood='angry', pupil_data=pupils)
         draw.line((130, 190, 190, 190), fill="WHITE", width=8)
-        self._display(image)
 
-    def show_amazing(self):
-        """Displays a wide-eyed, amazed face with a sparkle."""
-        image, draw = self._create_base_image()
+    def _paint_amazing(self, draw):
         pupils = [(0, 0, 25), (0, 0, 25)] # Big pupils
         self._draw_eyes(draw, mood='amazing', pupil_data=pupils)
         # Draw a star/sparkle in the corner
         sparkle_coords = [(70, 70), (80, 90), (100, 80), (90, 100), (80, 120), (70, 100), (50, 100), (60, 80)]
         draw.polygon(sparkle_coords, fill="WHITE")
         draw.ellipse((140, 170, 180, 210), fill="WHITE") # "O" mouth
-        self._display(image)
 
-    def show_confuse(self):
-        """Displays a confused face with pupils looking apart."""
-        image, draw = self._create_base_image()
+    def _paint_confuse(self, draw):
         pupils = [(-15, 0, 12), (15, 0, 12)] # Pupils look apart
         self._draw_eyes(draw, mood='confuse', pupil_data=pupils)
         draw.text((150, 170), "?", fill="WHITE", font=self.font)
-        self._display(image)
 
-    def show_scary(self):
-        """Displays glowing red eyes."""
-        image, draw = self._create_base_image()
+    def _paint_scary(self, draw):
         self._draw_eyes(draw, mood='scary') # The mood handles all drawing
-        self._display(image)
 
-    def animate_sleepy(self):
-        """Animates the face falling asleep."""
-        for i in range(3):
-            image, draw = self._create_base_image()
-            self._draw_eyes(draw, mood='sleepy')
-            self._display(image)
-            time.sleep(0.5)
-            self.show_idle()
-            time.sleep(1.0 - i * 0.3)
-        # Final "asleep" face
-        image, draw = self._create_base_image()
+    def _paint_sleepy(self, draw):
+        self._draw_eyes(draw, mood='sleepy')
+
+    def _paint_asleep(self, draw):
         draw.arc((80 - 40, 100 - 20, 80 + 40, 100 + 20), 180, 360, fill="WHITE", width=6)
         draw.arc((240 - 40, 100 - 20, 240 + 40, 100 + 20), 180, 360, fill="WHITE", width=6)
         draw.text((260, 40), "Zzz", fill="WHITE", font=self.font)
-        self._display(image)
+
+    def _paint_cry(self, draw, y_offset):
+        self._paint_sad(draw)
+        # Draw the tear at its current position
+        tear_x, tear_y = 240, 140
+        draw.ellipse((tear_x - 5, tear_y + y_offset - 10, tear_x + 5, tear_y + y_offset + 10), fill="CYAN")
+
+    # --- Public Methods for Each Expression ---
+
+    def show_idle(self):
+        """Displays a neutral, blinking face."""
+        self._show('idle')
+
+    def show_happy(self):
+        """Displays a happy face with a big smile."""
+        self._show('happy')
+
+    def show_sad(self):
+        """Displays a sad face with downturned pupils and a frown."""
+        self._show('sad')
+
+    def show_angry(self):
+        """Displays an angry face."""
+        self._show('angry')
+
+    def show_amazing(self):
+        """Displays a wide-eyed, amazed face with a sparkle."""
+        self._show('amazing')
+
+    def show_confuse(self):
+        """Displays a confused face with pupils looking apart."""
+        self._show('confuse')
+
+    def show_scary(self):
+        """Displays glowing red eyes."""
+        self._show('scary')
+
+    def animate_sleepy(self):
+        """Animates the face falling asleep."""
+        self._play_timeline(self.timeline('sleepy'))
 
     def animate_cry(self):
         """Animates a tear dropping from one eye."""
-        self.show_sad()
-        time.sleep(0.5)
-        for _ in range(3): # Drop 3 tears
-            for y_offset in range(0, 80, 10):
-                image, draw = self._create_base_image()
-                pupils = [(0, 15, 12), (0, 15, 12)]
-                self._draw_eyes(draw, mood='sad', pupil_data=pupils)
-                draw.arc((120, 190, 200, 220), 180, 360, fill="WHITE", width=8)
-                # Draw the tear at its current position
-                tear_x, tear_y = 240, 140
-                draw.ellipse((tear_x - 5, tear_y + y_offset - 10, tear_x + 5, tear_y + y_offset + 10), fill="CYAN")
-                self._display(image)
-                time.sleep(0.02)
-        self.show_sad()
+        self._play_timeline(self.timeline('cry'))
+
+    # --- Timelines (shared by the blocking animate_* methods and FacePlayer) ---
+
+    def timeline(self, expression):
+        """
+        Returns the frames of an expression as a list of (frame_name, hold_seconds).
+        The last frame stays on screen until the next expression.
+        """
+        if expression == 'sleepy':
+            frames = []
+            for i in range(3):
+                frames += [('sleepy', 0.5), ('idle', 1.0 - i * 0.3)]
+            return frames + [('asleep', 0)] # Final "asleep" face
+        if expression == 'cry':
+            tear_frames = [(f'cry_{i}', 0.02) for i in range(len(self.TEAR_OFFSETS))]
+            return [('sad', 0.5)] + tear_frames * 3 + [('sad', 0)] # Drop 3 tears
+        if expression in self._frames:
+            return [(expression, 0)]
+        raise ValueError(f"Unknown expression '{expression}'")
+
+    def show_frame(self, frame_name):
+        """Sends one pre-rendered frame by name."""
+        self._show(frame_name)
+
+    def _play_timeline(self, frames):
+        """Plays a timeline in the calling thread (blocking)."""
+        for frame_name, hold in frames:
+            self._show(frame_name)
+            if hold:
+                time.sleep(hold)